@@ -0,0 +1,114 @@
+"""
+Measures and summarizes repeated timings of type checker runs.
+"""
+
+from collections import Counter
+from functools import cache
+import math
+import os
+import statistics
+from time import time
+from typing import Callable, Sequence
+
+
+# The exact distribution of the Mann-Whitney U statistic is used when there
+# are at most this many samples in total and no ties.
+MAX_EXACT_SAMPLES = 30
+
+
+def measure(func: Callable[[], object]) -> tuple[float, float]:
+    """Call the function and return the wall time and CPU time it took.
+
+    The CPU time includes any child processes that were started and
+    waited for during the call, so it covers type checkers that run in
+    a subprocess as well as those that run in-process.
+    """
+    times_before = os.times()
+    start_time = time()
+    func()
+    wall_time = time() - start_time
+    times_after = os.times()
+
+    cpu_time = sum(
+        getattr(times_after, field) - getattr(times_before, field)
+        for field in ("user", "system", "children_user", "children_system")
+    )
+    return wall_time, cpu_time
+
+
+def summarize(samples: Sequence[float]) -> dict[str, float]:
+    """Return the min, median, 95th percentile and standard deviation of
+    a set of samples."""
+    if len(samples) > 1:
+        p95 = statistics.quantiles(samples, n=20, method="inclusive")[-1]
+        stddev = statistics.stdev(samples)
+    else:
+        p95 = samples[0]
+        stddev = 0.0
+
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "p95": p95,
+        "stddev": stddev,
+    }
+
+
+def mann_whitney_greater(baseline: Sequence[float], samples: Sequence[float]) -> float:
+    """Return the p-value of a one-sided Mann-Whitney U test that the
+    samples tend to be larger than the baseline.
+
+    The exact distribution of U is used for small sets of samples without
+    ties. Otherwise, the normal approximation is used, with corrections for
+    ties and continuity."""
+    n1 = len(samples)
+    n2 = len(baseline)
+    # U is the number of pairs in which the sample is larger than the
+    # baseline, with ties counted as half.
+    u = sum(
+        1.0 if sample > base else 0.5 if sample == base else 0.0
+        for sample in samples
+        for base in baseline
+    )
+
+    tie_counts = Counter([*samples, *baseline]).values()
+    if n1 + n2 <= MAX_EXACT_SAMPLES and all(count == 1 for count in tie_counts):
+        counts = _get_u_counts(n1, n2)
+        return sum(counts[int(u) :]) / math.comb(n1 + n2, n1)
+
+    n = n1 + n2
+    tie_term = sum(count**3 - count for count in tie_counts) / (n * (n - 1))
+    variance = n1 * n2 / 12 * (n + 1 - tie_term)
+    if variance == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 1 - statistics.NormalDist().cdf(z)
+
+
+def min_mann_whitney_greater(n1: int, n2: int) -> float:
+    """Return the smallest p-value that mann_whitney_greater can give for
+    n1 samples and n2 baseline values without ties, which is when every
+    sample is larger than every baseline value."""
+    n = n1 + n2
+    if n <= MAX_EXACT_SAMPLES:
+        return 1 / math.comb(n, n1)
+    z = (n1 * n2 / 2 - 0.5) / math.sqrt(n1 * n2 / 12 * (n + 1))
+    return 1 - statistics.NormalDist().cdf(z)
+
+
+@cache
+def _get_u_counts(n1: int, n2: int) -> tuple[int, ...]:
+    """Return the number of orderings of n1 samples and n2 baseline values
+    that give each value of U, from 0 to n1 * n2."""
+    if n1 == 0 or n2 == 0:
+        return (1,)
+    # The largest value is either a sample, which is larger than all of the
+    # baseline, or a baseline value, which no sample is larger than.
+    largest_is_sample = _get_u_counts(n1 - 1, n2)
+    largest_is_baseline = _get_u_counts(n1, n2 - 1)
+    counts = [0] * (n1 * n2 + 1)
+    for u, count in enumerate(largest_is_sample):
+        counts[u + n2] += count
+    for u, count in enumerate(largest_is_baseline):
+        counts[u] += count
+    return tuple(counts)
@@ -0,0 +1,148 @@
+"""
+Tracks the import dependencies between conformance tests and the
+helper modules that they import.
+"""
+
+from dataclasses import dataclass
+from functools import cache
+import json
+from pathlib import Path
+import re
+from typing import Sequence
+
+
+_IMPORT_RE = re.compile(
+    r"^\s*(?:from\s+(\w+)\s+import\b|import\s+([\w\s,.]+?)\s*(?:#.*)?$)",
+    re.MULTILINE,
+)
+
+# Bump this if the format of the cached graph changes.
+GRAPH_FORMAT_VERSION = 1
+
+
+@dataclass
+class DependencyGraph:
+    # Maps the name of each file in the tests directory to the names
+    # of the files in the same directory that it imports directly.
+    imports: dict[str, list[str]]
+
+    def get_dependencies(self, file_name: str) -> Sequence[str]:
+        """Return the files imported (directly or indirectly) by a file."""
+        return self._walk(file_name, self.imports)
+
+    def get_dependents(self, file_name: str) -> Sequence[str]:
+        """Return the files that import (directly or indirectly) a file."""
+        imported_by: dict[str, list[str]] = {}
+        for importer, imported_files in self.imports.items():
+            for imported in imported_files:
+                imported_by.setdefault(imported, []).append(importer)
+        return self._walk(file_name, imported_by)
+
+    @staticmethod
+    def _walk(file_name: str, edges: dict[str, list[str]]) -> Sequence[str]:
+        visited: set[str] = {file_name}
+        pending = [file_name]
+        while pending:
+            for neighbor in edges.get(pending.pop(), []):
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    pending.append(neighbor)
+        visited.remove(file_name)
+        return sorted(visited)
+
+
+def _find_imports(source: str, local_files: set[str]) -> list[str]:
+    imports: list[str] = []
+    for match in _IMPORT_RE.finditer(source):
+        if match.group(1):
+            module_names = [match.group(1)]
+        else:
+            module_names = [
+                name.split()[0].split(".")[0]
+                for name in match.group(2).split(",")
+                if name.strip()
+            ]
+
+        # Record both the ".py" and ".pyi" file for a module if present.
+        for module_name in module_names:
+            for suffix in (".py", ".pyi"):
+                file_name = f"{module_name}{suffix}"
+                if file_name in local_files and file_name not in imports:
+                    imports.append(file_name)
+    return imports
+
+
+@cache
+def get_dependency_graph(tests_dir: Path) -> DependencyGraph:
+    """Build the import graph for the files in the tests directory.
+
+    The imports found in each file are cached in ".cache/dependencies.json"
+    next to the tests directory, so only files that have changed since the
+    last run are scanned again.
+    """
+    tests_dir = tests_dir.resolve()
+    cache_file = tests_dir.parent / ".cache" / "dependencies.json"
+
+    try:
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+        if cached.get("version") != GRAPH_FORMAT_VERSION:
+            cached = {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        cached = {}
+    cached_files: dict[str, dict] = cached.get("files", {})
+
+    paths = sorted(p for p in tests_dir.iterdir() if p.suffix in (".py", ".pyi"))
+    local_files = {p.name for p in paths}
+
+    files: dict[str, dict] = {}
+    for path in paths:
+        stat = path.stat()
+        entry = cached_files.get(path.name)
+        if (
+            entry is None
+            or entry["mtime_ns"] != stat.st_mtime_ns
+            or entry["size"] != stat.st_size
+        ):
+            source = path.read_text(encoding="utf-8")
+            entry = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "imports": _find_imports(source, local_files),
+            }
+        files[path.name] = entry
+
+    if files != cached_files:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file, "w") as f:
+            json.dump({"version": GRAPH_FORMAT_VERSION, "files": files}, f, indent=1)
+
+    return DependencyGraph(
+        {name: entry["imports"] for name, entry in files.items()}
+    )
+
+
+def get_helper_files(test_case: Path) -> Sequence[Path]:
+    """Return the helper modules imported (directly or indirectly) by a test case.
+
+    Only modules that live alongside the test case are considered. Both the
+    ".py" and ".pyi" files for a helper module are returned if present.
+    """
+    graph = get_dependency_graph(test_case.parent)
+    return [test_case.parent / name for name in graph.get_dependencies(test_case.name)]
+
+
+def get_files_to_check(test_files: Sequence[str]) -> Sequence[str]:
+    """Return the test files along with the helper modules they import.
+
+    If a helper module has both a ".py" and a ".pyi" file, only the stub
+    is returned, because that is what type checkers resolve the import to.
+    """
+    files = list(test_files)
+    for test_file in test_files:
+        for helper_file in get_helper_files(Path(test_file)):
+            if helper_file.suffix == ".py" and helper_file.with_suffix(".pyi").is_file():
+                continue
+            if helper_file.name not in files:
+                files.append(helper_file.name)
+    return files
@@ -0,0 +1,31 @@
+"""
+A structured representation of the diagnostics reported by type checkers.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class Diagnostic:
+    # The name of the file the diagnostic was reported in.
+    file: str
+
+    # The line (1-based) on which the diagnostic was reported.
+    line: int
+
+    # The column (1-based), if the type checker reports one.
+    column: int | None
+
+    # The severity, such as "error", "warning" or "note".
+    severity: str
+
+    # The error code or rule name, such as "arg-type", if there is one.
+    code: str | None
+
+    # The message, without the location, severity or code.
+    message: str
+
+    # The first line of the diagnostic as it appears in the type checker's
+    # output. This is what ignore_errors entries are matched against and
+    # what is shown for unexpected errors in errors_diff.
+    text: str
@@ -0,0 +1,237 @@
+"""
+Provisions a separate virtual environment for each type checker, so that
+type checkers can be installed independently of each other and of the
+test tool, and in parallel.
+
+Environments are cached in ".cache/venvs" and keyed by the version of the
+type checker. The version of a type checker listed in "checkers.lock" is
+pinned, so its environment is reused without checking for a new version;
+the version of any other type checker is the latest one on the index.
+
+Packages are installed from a local wheelhouse, ".cache/wheelhouse", with
+no index access. A pinned version that isn't in the wheelhouse yet is
+downloaded into it first, so a populated wheelhouse can be copied to a
+machine without network access.
+"""
+
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import shutil
+from subprocess import PIPE, run
+import sys
+import sysconfig
+import threading
+
+import tomli
+import tomlkit
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+CACHE_DIR = ROOT_DIR / ".cache" / "venvs"
+
+WHEELHOUSE_DIR = ROOT_DIR / ".cache" / "wheelhouse"
+
+LOCK_FILE = ROOT_DIR / "checkers.lock"
+
+# Type checkers are installed in parallel, and their downloads share
+# dependencies, so only one download into the wheelhouse runs at a time.
+_wheelhouse_lock = threading.Lock()
+
+# The name of the file that marks an environment as completely installed.
+_INSTALLED_MARKER = ".installed"
+
+# The extras to install with each package, so that everything it needs to
+# run comes from the wheelhouse. The pyright package is a wrapper that
+# otherwise downloads Node.js the first time it is run.
+PACKAGE_EXTRAS = {"pyright": ["nodejs"]}
+
+
+@dataclass(frozen=True)
+class Environment:
+    # The directory of the virtual environment.
+    path: Path
+
+    def get_script(self, name: str) -> str:
+        """
+        Returns the path of a script installed in the environment.
+        """
+        if os.name == "nt":
+            return str(self.path / "Scripts" / f"{name}.exe")
+        return str(self.path / "bin" / name)
+
+    def get_python(self) -> str:
+        return self.get_script("python")
+
+    def get_site_packages(self) -> str:
+        # The environment uses the same version of Python as the test tool,
+        # so its layout can be found without running its interpreter.
+        return sysconfig.get_path(
+            "purelib", vars={"base": str(self.path), "platbase": str(self.path)}
+        )
+
+
+def resolve_version(package: str) -> str:
+    """
+    Returns the latest version of a package, as pip would install it.
+    """
+    proc = run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "install",
+            "--dry-run",
+            "--ignore-installed",
+            "--no-deps",
+            "--quiet",
+            "--report",
+            "-",
+            package,
+        ],
+        stdout=PIPE,
+        text=True,
+        check=True,
+    )
+    report = json.loads(proc.stdout)
+    return report["install"][0]["metadata"]["version"]
+
+
+def read_lock_file() -> dict[str, str]:
+    """
+    Returns the pinned version of each package in the lock file, keyed by
+    the package name.
+    """
+    if not LOCK_FILE.is_file():
+        return {}
+    with open(LOCK_FILE, "rb") as f:
+        return dict(tomli.load(f))
+
+
+def update_lock_file() -> None:
+    """
+    Pins each package in the lock file to its latest version and downloads
+    that version into the wheelhouse.
+    """
+    with open(LOCK_FILE, "r") as f:
+        lock = tomlkit.load(f)
+
+    for package, old_version in lock.items():
+        version = resolve_version(package)
+        download_to_wheelhouse(package, version)
+        if version != old_version:
+            print(f"Pinning {package} {version} (was {old_version})")
+            lock[package] = version
+
+    with open(LOCK_FILE, "w") as f:
+        tomlkit.dump(lock, f)
+
+
+def _get_requirement(package: str, version: str) -> str:
+    """
+    Returns the requirement that installs a version of a package along
+    with its extras.
+    """
+    extras = PACKAGE_EXTRAS.get(package)
+    if extras:
+        return f"{package}[{','.join(extras)}]=={version}"
+    return f"{package}=={version}"
+
+
+def _is_in_wheelhouse(requirement: str) -> bool:
+    # Resolve the requirement from the wheelhouse alone, so that this also
+    # checks for its dependencies and extras.
+    proc = run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "download",
+            "--quiet",
+            "--no-index",
+            "--find-links",
+            str(WHEELHOUSE_DIR),
+            "--dest",
+            str(WHEELHOUSE_DIR),
+            requirement,
+        ],
+        stdout=PIPE,
+        stderr=PIPE,
+    )
+    return proc.returncode == 0
+
+
+def download_to_wheelhouse(package: str, version: str) -> None:
+    """
+    Downloads a version of a package and its dependencies into the
+    wheelhouse, unless it is already there.
+    """
+    requirement = _get_requirement(package, version)
+    with _wheelhouse_lock:
+        if _is_in_wheelhouse(requirement):
+            return
+        print(f"Downloading {requirement}")
+        run(
+            [
+                sys.executable,
+                "-m",
+                "pip",
+                "download",
+                "--quiet",
+                "--dest",
+                str(WHEELHOUSE_DIR),
+                requirement,
+            ],
+            check=True,
+        )
+
+
+def provision_environment(package: str) -> Environment:
+    """
+    Returns an environment with the pinned or latest version of a package
+    installed, creating it if there isn't one already. Environments with
+    other versions of the package are removed. Raises CalledProcessError if
+    the package can't be installed.
+    """
+    version = read_lock_file().get(package) or resolve_version(package)
+    environment = Environment(CACHE_DIR / f"{package}-{version}")
+    requirement = _get_requirement(package, version)
+
+    # The marker records the requirement that was installed, so that the
+    # environment is reinstalled if the extras for the package change.
+    marker = environment.path / _INSTALLED_MARKER
+    if marker.is_file() and marker.read_text() == requirement:
+        print(f"Using the cached environment for {package} {version}")
+        return environment
+
+    download_to_wheelhouse(package, version)
+
+    print(f"Installing {package} {version}")
+    shutil.rmtree(environment.path, ignore_errors=True)
+    run([sys.executable, "-m", "venv", str(environment.path)], check=True)
+    run(
+        [
+            environment.get_python(),
+            "-m",
+            "pip",
+            "install",
+            "--no-index",
+            "--find-links",
+            str(WHEELHOUSE_DIR),
+            requirement,
+        ],
+        stdout=PIPE,
+        check=True,
+    )
+    marker.write_text(requirement)
+
+    # Remove the environments for any other versions of the package. The
+    # version must follow the name, so "pyre-check-*" isn't removed for "pyre".
+    for path in CACHE_DIR.glob(f"{package}-*"):
+        version_suffix = path.name.removeprefix(f"{package}-")
+        if path != environment.path and version_suffix[:1].isdigit():
+            shutil.rmtree(path, ignore_errors=True)
+
+    return environment
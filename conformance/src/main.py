@@ -2,45 +2,425 @@
 Type system conformance test for static type checkers.
 """
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
 import os
 from pathlib import Path
 import re
 import sys
-from time import time
+from time import sleep, time
 from typing import Sequence
 
-import tomli
-import tomlkit
+from tqdm import tqdm
 
-from options import parse_options
+from benchmark import measure, summarize
+from dependencies import get_dependency_graph
+from diagnostics import Diagnostic
+from environments import update_lock_file
+from memory_ceiling import find_memory_ceiling
+from options import _Options, parse_options
+from performance_history import PerformanceEntry, Regression, get_machine_fingerprint
+from registry import get_registered_type_checkers
 from reporting import generate_summary
-from test_groups import get_test_cases, get_test_groups
-from type_checker import TYPE_CHECKERS, TypeChecker
+from resource_usage import track_resource_usage
+from result_cache import ResultCache
+from results_model import ResultsModel
+from results_store import TestResult
+from test_groups import get_test_cases, get_test_groups, select_test_cases
+from tracing import (
+    add_trace_events,
+    init_worker_tracing,
+    is_tracing,
+    set_tracing,
+    span,
+    take_trace_events,
+    write_trace,
+)
+from type_checker import (
+    DmypyTypeChecker,
+    MypyTypeChecker,
+    PyrightLanguageServerTypeChecker,
+    PyrightTypeChecker,
+    PyreServerTypeChecker,
+    PyreTypeChecker,
+    PytypeTypeChecker,
+    TypeChecker,
+)
+
+
+@dataclass
+class TypeCheckerRun:
+    # The output of the type checker, keyed by test file name.
+    tests_output: dict[str, str]
+
+    # The wall-clock time taken by the type checker.
+    test_duration: float
+
+    # Any additional timings reported by the type checker.
+    timing_info: dict[str, float] = field(default_factory=dict)
+
+    # The diagnostics for each test file, keyed by file name, if the type
+    # checker reports structured diagnostics.
+    diagnostics: dict[str, list[Diagnostic]] = field(default_factory=dict)
+
+    # The time taken to check each test file, keyed by file name. This is
+    # only recorded if per-test timing is enabled.
+    test_durations: dict[str, float] = field(default_factory=dict)
+
+    # The peak memory used to check each test file, in MB, keyed by file
+    # name. This is only recorded when each file is timed in a separate run.
+    test_peak_rss_mb: dict[str, float] = field(default_factory=dict)
+
+    # Statistics for the wall and CPU times of repeated runs, such as
+    # "wall_median". This is only recorded in benchmark mode.
+    benchmark: dict[str, float] = field(default_factory=dict)
+
+    # The wall time of each of the repeated runs in benchmark mode.
+    benchmark_wall_times: list[float] = field(default_factory=list)
+
+    # The peak memory, CPU time and context switches used by the type
+    # checker run, such as "peak_rss_mb".
+    resource_usage: dict[str, float] = field(default_factory=dict)
+
+    # Trace events recorded in a worker process, to be added to the trace
+    # in the main process.
+    trace_events: list[dict] = field(default_factory=list)
 
 
 def run_tests(
     root_dir: Path,
+    results: ResultsModel,
     type_checker: TypeChecker,
     test_cases: Sequence[Path],
     skip_timing: bool = False,
+    full_suite: bool = True,
+    force: bool = False,
+    per_test_timing: bool = False,
+    benchmark_runs: int = 0,
+    benchmark_warmups: int = 0,
 ):
-    print(f"Running tests for {type_checker.name}")
+    result_cache = ResultCache(root_dir / ".cache", type_checker)
+    cached_output, uncached_cases = get_cached_output(result_cache, test_cases, force)
+
+    checker_run = None
+    if uncached_cases:
+        print(f"Running tests for {type_checker.name}")
+        checker_run = run_type_checker(
+            type_checker,
+            [file.name for file in uncached_cases],
+            per_test_timing=per_test_timing and not skip_timing,
+            benchmark_runs=benchmark_runs,
+            benchmark_warmups=benchmark_warmups,
+        )
+        cache_output(result_cache, uncached_cases, checker_run.tests_output)
+    else:
+        print(f"Using cached results for {type_checker.name}")
+
+    record_results(
+        results,
+        type_checker,
+        test_cases,
+        cached_output,
+        checker_run,
+        skip_timing=skip_timing,
+        full_suite=full_suite,
+    )
+
+
+def run_tests_concurrently(
+    root_dir: Path,
+    results: ResultsModel,
+    type_checkers: Sequence[TypeChecker],
+    test_cases: Sequence[Path],
+    jobs: int,
+    skip_timing: bool = False,
+    full_suite: bool = True,
+    force: bool = False,
+    per_test_timing: bool = False,
+    benchmark_runs: int = 0,
+    benchmark_warmups: int = 0,
+):
+    """Runs each type checker in its own worker process, with at most
+    `jobs` type checkers running at once. Results are recorded in the
+    main process as each type checker finishes.
+    """
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker_tracing, initargs=(is_tracing(),)
+    ) as executor:
+        futures = {}
+        for type_checker in type_checkers:
+            result_cache = ResultCache(root_dir / ".cache", type_checker)
+            cached_output, uncached_cases = get_cached_output(
+                result_cache, test_cases, force
+            )
+
+            if not uncached_cases:
+                print(f"Using cached results for {type_checker.name}")
+                record_results(results, type_checker, test_cases, cached_output, None)
+                continue
+
+            print(f"Running tests for {type_checker.name}")
+            future = executor.submit(
+                run_type_checker_in_worker,
+                type_checker,
+                [file.name for file in uncached_cases],
+                per_test_timing=per_test_timing and not skip_timing,
+                benchmark_runs=benchmark_runs,
+                benchmark_warmups=benchmark_warmups,
+            )
+            futures[future] = (type_checker, result_cache, cached_output, uncached_cases)
+
+        for future in as_completed(futures):
+            type_checker, result_cache, cached_output, uncached_cases = futures[future]
+            checker_run = future.result()
+            add_trace_events(checker_run.trace_events)
+            print(
+                f"Finished tests for {type_checker.name} "
+                f"in {checker_run.test_duration:.1f}sec"
+            )
+            cache_output(result_cache, uncached_cases, checker_run.tests_output)
+
+            record_results(
+                results,
+                type_checker,
+                test_cases,
+                cached_output,
+                checker_run,
+                skip_timing=skip_timing,
+                full_suite=full_suite,
+            )
+
+
+def get_cached_output(
+    result_cache: ResultCache, test_cases: Sequence[Path], force: bool = False
+) -> tuple[dict[str, str], list[Path]]:
+    """Return the cached output for the test cases, keyed by file name,
+    along with the test cases that have no cached output and must be run.
+    """
+    if force:
+        return {}, list(test_cases)
+
+    cached_output: dict[str, str] = {}
+    uncached_cases: list[Path] = []
+    with span("get_cached_output"):
+        for test_case in test_cases:
+            output = result_cache.get(test_case)
+            if output is None:
+                uncached_cases.append(test_case)
+            else:
+                cached_output[test_case.name] = output
 
-    test_start_time = time()
-    tests_output = type_checker.run_tests([file.name for file in test_cases])
-    test_duration = time() - test_start_time
+    return cached_output, uncached_cases
 
-    for _, output in tests_output.items():
-        type_checker.parse_errors(output.splitlines())
 
-    results_dir = root_dir / "results" / type_checker.name
+def cache_output(
+    result_cache: ResultCache, test_cases: Sequence[Path], tests_output: dict[str, str]
+):
+    with span("cache_output"):
+        for test_case in test_cases:
+            result_cache.put(test_case, tests_output.get(test_case.name, ""))
 
-    for test_case in test_cases:
-        update_output_for_test(
-            type_checker, results_dir, test_case, tests_output.get(test_case.name, "")
+
+def run_type_checker(
+    type_checker: TypeChecker,
+    test_files: Sequence[str],
+    close: bool = False,
+    per_test_timing: bool = False,
+    benchmark_runs: int = 0,
+    benchmark_warmups: int = 0,
+) -> TypeCheckerRun:
+    """Run the type checker on the test files and return its output along
+    with the time and resources it took. The measurements cover only the
+    type checker run, so they remain accurate when this is called in a
+    worker process.
+
+    If per_test_timing is true, the time taken for each test file is also
+    recorded. Type checkers that check one file at a time report this
+    themselves. Otherwise, each file is timed in a separate run with the
+    type checker's cache cleared.
+
+    If benchmark_runs is nonzero, the type checker is then run that many
+    more times, after benchmark_warmups unmeasured runs, and statistics for
+    the timings of those runs are recorded.
+
+    If close is true, any servers started by the type checker are shut down
+    afterwards. A worker process must do this, because its copy of the type
+    checker is discarded once the run is complete.
+    """
+    try:
+        with (
+            span("run_tests", type_checker=type_checker.name),
+            track_resource_usage() as usage,
+        ):
+            test_start_time = time()
+            tests_output = type_checker.run_tests(test_files)
+            test_duration = time() - test_start_time
+        checker_run = TypeCheckerRun(
+            tests_output,
+            test_duration,
+            type_checker.get_timing_info(),
+            dict(type_checker.get_diagnostics()),
+            resource_usage=usage.as_dict(),
         )
 
-    update_type_checker_info(type_checker, root_dir, test_duration, skip_timing=skip_timing)
+        if benchmark_runs:
+            with span("benchmark", type_checker=type_checker.name):
+                checker_run.benchmark, checker_run.benchmark_wall_times = (
+                    benchmark_type_checker(
+                        type_checker, test_files, benchmark_runs, benchmark_warmups
+                    )
+                )
+
+        if per_test_timing:
+            checker_run.test_durations = dict(type_checker.get_test_durations())
+            if not checker_run.test_durations:
+                for test_file in tqdm(test_files, desc="Timing each test"):
+                    # Otherwise each test would be an incremental check
+                    # against the cache from the full run.
+                    type_checker.clear_cache()
+                    with (
+                        span("run_tests", type_checker=type_checker.name, test=test_file),
+                        track_resource_usage() as test_usage,
+                    ):
+                        test_start_time = time()
+                        type_checker.run_tests([test_file])
+                        checker_run.test_durations[test_file] = time() - test_start_time
+                    checker_run.test_peak_rss_mb[test_file] = test_usage.peak_rss_mb
+    finally:
+        if close:
+            type_checker.close()
+
+    return checker_run
+
+
+def run_type_checker_in_worker(
+    type_checker: TypeChecker, test_files: Sequence[str], **kwargs
+) -> TypeCheckerRun:
+    """Run the type checker in a worker process, closing it afterwards and
+    passing back any trace events recorded in the worker."""
+    checker_run = run_type_checker(type_checker, test_files, close=True, **kwargs)
+    checker_run.trace_events = take_trace_events()
+    return checker_run
+
+
+def benchmark_type_checker(
+    type_checker: TypeChecker, test_files: Sequence[str], runs: int, warmups: int
+) -> tuple[dict[str, float], list[float]]:
+    """Run the type checker repeatedly and return statistics for the
+    timings along with the wall time of each run. The type checker's cache
+    is cleared before each run, so that every run is a full check rather
+    than an incremental one."""
+    for _ in tqdm(range(warmups), desc=f"Warming up {type_checker.name}"):
+        type_checker.clear_cache()
+        type_checker.run_tests(test_files)
+
+    wall_times: list[float] = []
+    cpu_times: list[float] = []
+    for _ in tqdm(range(runs), desc=f"Benchmarking {type_checker.name}"):
+        type_checker.clear_cache()
+        wall_time, cpu_time = measure(lambda: type_checker.run_tests(test_files))
+        wall_times.append(wall_time)
+        cpu_times.append(cpu_time)
+
+    benchmark: dict[str, float] = {"runs": runs, "warmups": warmups}
+    for kind, samples in (("wall", wall_times), ("cpu", cpu_times)):
+        for stat, value in summarize(samples).items():
+            benchmark[f"{kind}_{stat}"] = round(value, 3)
+    return benchmark, wall_times
+
+
+def record_results(
+    results: ResultsModel,
+    type_checker: TypeChecker,
+    test_cases: Sequence[Path],
+    cached_output: dict[str, str],
+    checker_run: TypeCheckerRun | None,
+    skip_timing: bool = False,
+    full_suite: bool = True,
+):
+    """Record the output of the type checker for each test case, and its
+    version and timings. The overall timings are only recorded if
+    full_suite is true and the type checker was run on every test case,
+    since they are meaningless for part of the suite."""
+    # Pick up any edits to the results files, such as new ignore_errors, so
+    # that they are used to score the output and aren't overwritten.
+    results.reload()
+
+    tests_output = dict(cached_output)
+    if checker_run is not None:
+        tests_output.update(checker_run.tests_output)
+
+    # Parse the output of each test once, unless the type checker already
+    # reported structured diagnostics for it.
+    diagnostics: dict[str, list[Diagnostic]] = {}
+    if checker_run is not None:
+        diagnostics.update(checker_run.diagnostics)
+    for test_name, output in tests_output.items():
+        if test_name not in diagnostics:
+            with span("parse_diagnostics", type_checker=type_checker.name, test=test_name):
+                diagnostics[test_name] = type_checker.parse_diagnostics(output)
+
+    with span("get_version", type_checker=type_checker.name):
+        version = type_checker.get_version()
+
+    test_durations: dict[str, float] = {}
+    test_peak_rss_mb: dict[str, float] = {}
+    regressions: dict[str | None, Regression] = {}
+    if checker_run is not None and not skip_timing:
+        test_durations = checker_run.test_durations
+        test_peak_rss_mb = checker_run.test_peak_rss_mb
+
+        # Add the timings to the performance history and compare them with
+        # those of the previous version of the type checker.
+        entry = PerformanceEntry(
+            checker=type_checker.name,
+            version=version,
+            machine=get_machine_fingerprint(),
+            time=PerformanceEntry.get_current_time(),
+            tests=sorted(case.name for case in test_cases if case.name not in cached_output),
+            wall_times=[
+                round(wall_time, 3)
+                for wall_time in checker_run.benchmark_wall_times or [checker_run.test_duration]
+            ],
+            peak_rss_mb=checker_run.resource_usage.get("peak_rss_mb"),
+            test_durations={test: round(t, 3) for test, t in test_durations.items()},
+            test_peak_rss_mb=test_peak_rss_mb,
+        )
+        results.history.append(entry)
+        with span("find_regressions", type_checker=type_checker.name):
+            regressions = results.history.find_regressions(entry)
+
+    for test_case in test_cases:
+        with span(
+            "update_output_for_test", type_checker=type_checker.name, test=test_case.name
+        ):
+            update_output_for_test(
+                type_checker,
+                results,
+                version,
+                test_case,
+                tests_output.get(test_case.name, ""),
+                diagnostics.get(test_case.name, []),
+                test_durations.get(test_case.name),
+                test_peak_rss_mb.get(test_case.name),
+                regressions.get(test_case.name),
+            )
+
+    if None in regressions:
+        print(f"Slowdown when running {type_checker.name}: {regressions[None].describe()}")
+        print("")
+
+    with span("update_type_checker_info", type_checker=type_checker.name):
+        update_type_checker_info(
+            type_checker,
+            results,
+            version,
+            checker_run,
+            skip_timing=skip_timing,
+            # The overall timings are only meaningful if the full set of
+            # tests was run.
+            full_suite=full_suite and not cached_output,
+        )
 
 
 def get_expected_errors(test_case: Path) -> tuple[
@@ -96,21 +476,18 @@ def get_expected_errors(test_case: Path) -> tuple[
 def diff_expected_errors(
     type_checker: TypeChecker,
     test_case: Path,
-    output: str,
+    diagnostics: Sequence[Diagnostic],
     ignored_errors: Sequence[str],
 ) -> str:
     """Return a list of errors that were expected but not produced by the type checker."""
     expected_errors, error_groups = get_expected_errors(test_case)
-    errors = type_checker.parse_errors(output.splitlines())
-    if ignored_errors:
-        errors = {
-            lineno: [
-                error
-                for error in errors_list
-                if not any(ignored in error for ignored in ignored_errors)]
-            for lineno, errors_list in errors.items()
-        }
-        errors = {lineno: errors_list for lineno, errors_list in errors.items() if errors_list}
+    errors: dict[int, list[str]] = {}
+    for diagnostic in diagnostics:
+        if not type_checker.is_error(diagnostic):
+            continue
+        if any(ignored in diagnostic.text for ignored in ignored_errors):
+            continue
+        errors.setdefault(diagnostic.line, []).append(diagnostic.text)
 
     differences: list[str] = []
     for expected_lineno, (expected_count, _) in expected_errors.items():
@@ -132,31 +509,30 @@ def diff_expected_errors(
 
 def update_output_for_test(
     type_checker: TypeChecker,
-    results_dir: Path,
+    results: ResultsModel,
+    version: str,
     test_case: Path,
     output: str,
+    diagnostics: Sequence[Diagnostic],
+    test_duration: float | None = None,
+    peak_rss_mb: float | None = None,
+    regression: Regression | None = None,
 ):
     test_name = test_case.stem
     output = f"\n{output}"
 
-    results_file = results_dir / f"{test_name}.toml"
-    results_file.parent.mkdir(parents=True, exist_ok=True)
-    should_write = False
+    with span("read_results"):
+        existing_results = results.get_result(type_checker.name, test_name)
+    should_write = existing_results is None
+    if existing_results is None:
+        existing_results = TestResult(test_name, version)
 
-    # Read the existing results file if present.
-    try:
-        with open(results_file, "rb") as f:
-            existing_results = tomli.load(f)
-    except FileNotFoundError:
-        should_write = True
-        existing_results = {}
-    except tomli.TOMLDecodeError:
-        print(f"Error decoding {results_file}")
-        existing_results = {}
-
-    ignored_errors = existing_results.get("ignore_errors", [])
-    errors_diff = "\n" + diff_expected_errors(type_checker, test_case, output, ignored_errors)
-    old_errors_diff = "\n" + existing_results.get("errors_diff", "")
+    ignored_errors = existing_results.ignore_errors or []
+    with span("diff_expected_errors"):
+        errors_diff = "\n" + diff_expected_errors(
+            type_checker, test_case, diagnostics, ignored_errors
+        )
+    old_errors_diff = "\n" + existing_results.errors_diff
 
     if errors_diff != old_errors_diff:
         should_write = True
@@ -166,12 +542,24 @@ def update_output_for_test(
         print("")
 
     conformance_automated = "Fail" if errors_diff.strip() else "Pass"
-    if existing_results.get("conformance_automated") != conformance_automated:
+    if existing_results.conformance_automated != conformance_automated:
         should_write = True
-        existing_results["conformance_automated"] = conformance_automated
 
-    old_output = existing_results.get("output", "")
-    old_output = f"\n{old_output}"
+    if test_duration is not None:
+        test_duration = round(test_duration, 2)
+        if existing_results.test_duration != test_duration:
+            should_write = True
+    else:
+        test_duration = existing_results.test_duration
+
+    if peak_rss_mb is not None:
+        peak_rss_mb = round(peak_rss_mb, 1)
+        if existing_results.peak_rss_mb != peak_rss_mb:
+            should_write = True
+    else:
+        peak_rss_mb = existing_results.peak_rss_mb
+
+    old_output = f"\n{existing_results.output}"
 
     # Did the type checker output change since last time the
     # test was run?
@@ -182,48 +570,181 @@ def update_output_for_test(
         print(f"New output: {output}")
         print("")
 
-        # Use multiline formatting for any strings that contain newlines.
-        for key, value in existing_results.items():
-            if isinstance(value, str) and "\n" in value:
-                existing_results[key] = tomlkit.string(f"\n{value}", multiline=True)
-
-    if should_write:
-        # Always reapply tomlkit.string, or it will turn into a single line.
-        existing_results["errors_diff"] = tomlkit.string(errors_diff, multiline=True)
-        existing_results["output"] = tomlkit.string(output, multiline=True)
-        if "notes" in existing_results:
-            notes = existing_results["notes"]
-            if not notes.startswith("\n"):
-                notes = "\n" + notes
-            existing_results["notes"] = tomlkit.string(notes, multiline=True)
-        results_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(results_file, "w") as f:
-            tomlkit.dump(existing_results, f)
+    if regression is not None:
+        print(f"Slowdown for {test_name} when running {type_checker.name}")
+        print(f"Time: {regression.describe()}")
+        print("")
+
+    # The results are stored for each version of the type checker, so they
+    # are stored again for a new version even if they are unchanged.
+    if should_write or existing_results.version != version:
+        new_results = replace(
+            existing_results,
+            version=version,
+            conformance_automated=conformance_automated,
+            output=output[1:],
+            errors_diff=errors_diff[1:],
+            test_duration=test_duration,
+            peak_rss_mb=peak_rss_mb,
+        )
+        results.put_result(type_checker.name, new_results, changed=should_write)
 
 
 def update_type_checker_info(
-    type_checker: TypeChecker, root_dir: Path, test_duration: float, skip_timing: bool = False
+    type_checker: TypeChecker,
+    results: ResultsModel,
+    version: str,
+    checker_run: TypeCheckerRun | None,
+    skip_timing: bool = False,
+    full_suite: bool = True,
 ):
     # Record the version of the type checker used for the latest run.
-    version_file = root_dir / "results" / type_checker.name / "version.toml"
+    existing_info = results.get_info(type_checker.name)
+
+    existing_info["version"] = version
+
+    # The timings reported by the type checker, such as the time taken by a
+    # warm run of a daemon, describe the run itself, so they are recorded
+    # even if it covered only some of the tests.
+    if checker_run is not None and not skip_timing:
+        for key, value in checker_run.timing_info.items():
+            existing_info[key] = round(value, 1)
+
+    if checker_run is not None and not skip_timing and full_suite:
+        existing_info["test_duration"] = round(checker_run.test_duration, 1)
+        # Drop the statistics from an earlier benchmark so that they aren't
+        # shown alongside timings from a newer run.
+        if checker_run.benchmark:
+            existing_info["benchmark"] = checker_run.benchmark
+        else:
+            existing_info.pop("benchmark", None)
+        if checker_run.resource_usage:
+            existing_info["resource_usage"] = checker_run.resource_usage
+        else:
+            existing_info.pop("resource_usage", None)
 
-    # Read the existing version file if present.
-    try:
-        with open(version_file, "rb") as f:
-            existing_info = tomli.load(f)
-    except FileNotFoundError:
-        existing_info = {}
-    except tomli.TOMLDecodeError:
-        print(f"Error decoding {version_file}")
-        existing_info = {}
+    results.put_info(type_checker.name, existing_info)
+
+
+def record_memory_ceiling(
+    type_checker: TypeChecker,
+    results: ResultsModel,
+    test_cases: Sequence[Path],
+    save: bool = True,
+):
+    """Search for the smallest memory limit under which the type checker
+    produces the same output, and record it in the version file if save
+    is true."""
+    print(f"Finding the memory ceiling for {type_checker.name}")
+    memory_ceiling_mb = find_memory_ceiling(
+        type_checker, [file.name for file in test_cases]
+    )
+    if memory_ceiling_mb is None:
+        print(f"Could not find a memory ceiling for {type_checker.name}")
+    else:
+        print(f"Memory ceiling for {type_checker.name} is {memory_ceiling_mb}MB")
+
+    if not save:
+        return
+
+    existing_info = results.get_info(type_checker.name)
+    if memory_ceiling_mb is None:
+        existing_info.pop("memory_ceiling_mb", None)
+    else:
+        existing_info["memory_ceiling_mb"] = memory_ceiling_mb
+    results.put_info(type_checker.name, existing_info)
+
+
+def watch_tests(
+    root_dir: Path,
+    results: ResultsModel,
+    type_checkers: Sequence[TypeChecker],
+    test_cases: Sequence[Path],
+    skip_timing: bool = False,
+    performance_columns: bool = False,
+):
+    """Rerun the affected test cases whenever a file in the tests directory
+    changes, until interrupted. The type checkers are run in this process
+    so that any servers they keep running are reused between runs. Only the
+    timings that the type checkers report for each run, such as the time of
+    an incremental recheck, are recorded.
+    """
+    tests_dir = root_dir / "tests"
 
-    existing_info["version"] = type_checker.get_version()
-    if not skip_timing:
-        existing_info["test_duration"] = round(test_duration, 1)
+    def get_mtimes() -> dict[str, int]:
+        return {p.name: p.stat().st_mtime_ns for p in tests_dir.iterdir() if p.is_file()}
 
-    version_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(version_file, "w") as f:
-        tomlkit.dump(existing_info, f)
+    print("Watching for changes to the tests (press Ctrl+C to stop)")
+    mtimes = get_mtimes()
+    try:
+        while True:
+            sleep(0.5)
+            new_mtimes = get_mtimes()
+            changed_files = [
+                name for name, mtime in new_mtimes.items() if mtimes.get(name) != mtime
+            ]
+            mtimes = new_mtimes
+            if not changed_files:
+                continue
+
+            # Rerun the changed tests and any tests that import a changed file.
+            get_dependency_graph.cache_clear()
+            graph = get_dependency_graph(tests_dir)
+            affected_files = set(changed_files)
+            for file_name in changed_files:
+                affected_files.update(graph.get_dependents(file_name))
+
+            affected_cases = [case for case in test_cases if case.name in affected_files]
+            if not affected_cases:
+                continue
+
+            for type_checker in type_checkers:
+                run_tests(
+                    root_dir,
+                    results,
+                    type_checker,
+                    affected_cases,
+                    skip_timing=skip_timing,
+                    full_suite=False,
+                )
+            results.save()
+            generate_summary(root_dir, results, performance_columns=performance_columns)
+    except KeyboardInterrupt:
+        pass
+
+
+def get_type_checkers(root_dir: Path, options: _Options) -> Sequence[TypeChecker]:
+    """Return the type checkers to run, replacing any whose alternative
+    backend was selected on the command line."""
+    type_checkers: list[TypeChecker] = []
+    for type_checker_info in get_registered_type_checkers(root_dir):
+        type_checker = type_checker_info.create()
+        if options.mypy_daemon and isinstance(type_checker, MypyTypeChecker):
+            type_checker = DmypyTypeChecker()
+        if options.pyright_server and isinstance(type_checker, PyrightTypeChecker):
+            type_checker = PyrightLanguageServerTypeChecker()
+        if options.pyre_server and isinstance(type_checker, PyreTypeChecker):
+            type_checker = PyreServerTypeChecker()
+        if isinstance(type_checker, PytypeTypeChecker):
+            type_checker.shards = options.pytype_shards
+        type_checkers.append(type_checker)
+    return type_checkers
+
+
+def install_type_checkers(
+    type_checkers: Sequence[TypeChecker],
+) -> list[tuple[TypeChecker, bool]]:
+    """Install the type checkers in parallel and return each one with
+    whether it was installed, in the order they were given."""
+
+    def install(type_checker: TypeChecker) -> bool:
+        with span("install", type_checker=type_checker.name):
+            return type_checker.install()
+
+    if not type_checkers:
+        return []
+    with ThreadPoolExecutor(max_workers=len(type_checkers)) as executor:
+        return list(zip(type_checkers, executor.map(install, type_checkers)))
 
 
 def main():
@@ -232,28 +753,112 @@ def main():
     assert sys.version_info >= (3, 12)
 
     options = parse_options(sys.argv[1:])
+    set_tracing(options.trace is not None)
 
     root_dir = Path(__file__).resolve().parent.parent
 
+    # Load the results once. They are updated as the tests are run and
+    # written to disk together afterwards.
+    results = ResultsModel(root_dir)
+
     if not options.report_only:
         tests_dir = root_dir / "tests"
         assert tests_dir.is_dir()
 
         test_groups = get_test_groups(root_dir)
         test_cases = get_test_cases(test_groups, tests_dir)
+        test_cases = select_test_cases(test_cases, options.tests, options.groups)
+        if not test_cases:
+            print("No test cases match the selected tests and groups")
+            sys.exit(1)
+
+        # Timings for the whole suite are only recorded if no tests were
+        # selected.
+        full_suite = not options.tests and not options.groups
 
         # Switch to the tests directory.
         os.chdir(tests_dir)
 
-        # Run each test case with each type checker.
-        for type_checker in TYPE_CHECKERS:
-            if not type_checker.install():
+        if options.update_lock:
+            with span("update lock"):
+                update_lock_file()
+
+        # Install each type checker. Each type checker is installed into its
+        # own environment, so they are installed in parallel.
+        type_checkers: list[TypeChecker] = []
+        for type_checker, installed in install_type_checkers(
+            get_type_checkers(root_dir, options)
+        ):
+            if not installed:
                 print(f"Skipping tests for {type_checker.name}")
             else:
-                run_tests(root_dir, type_checker, test_cases, skip_timing=options.skip_timing)
+                type_checkers.append(type_checker)
+
+        try:
+            # Run each test case with each type checker.
+            if options.jobs > 1:
+                run_tests_concurrently(
+                    root_dir,
+                    results,
+                    type_checkers,
+                    test_cases,
+                    options.jobs,
+                    skip_timing=options.skip_timing,
+                    full_suite=full_suite,
+                    force=options.force or options.benchmark > 0,
+                    per_test_timing=options.per_test_timing,
+                    benchmark_runs=options.benchmark,
+                    benchmark_warmups=options.warmups,
+                )
+            else:
+                for type_checker in type_checkers:
+                    run_tests(
+                        root_dir,
+                        results,
+                        type_checker,
+                        test_cases,
+                        skip_timing=options.skip_timing,
+                        full_suite=full_suite,
+                        force=options.force or options.benchmark > 0,
+                        per_test_timing=options.per_test_timing,
+                        benchmark_runs=options.benchmark,
+                        benchmark_warmups=options.warmups,
+                    )
+
+            if options.memory_ceiling:
+                # The ceiling only covers the whole suite if no tests were
+                # selected, so it is only recorded in that case.
+                for type_checker in type_checkers:
+                    record_memory_ceiling(
+                        type_checker, results, test_cases, save=full_suite
+                    )
+
+            results.save()
+
+            if options.watch:
+                watch_tests(
+                    root_dir,
+                    results,
+                    type_checkers,
+                    test_cases,
+                    skip_timing=options.skip_timing,
+                    performance_columns=options.performance_columns,
+                )
+        finally:
+            for type_checker in type_checkers:
+                type_checker.close()
+
+            # Save any results recorded before an error or interruption.
+            results.save()
 
     # Generate a summary report.
-    generate_summary(root_dir)
+    with span("generate_summary"):
+        generate_summary(
+            root_dir, results, performance_columns=options.performance_columns
+        )
+
+    if options.trace is not None:
+        write_trace(Path(options.trace))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+"""
+Finds the smallest memory limit under which a type checker still
+produces the same output for the conformance tests.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+from typing import Sequence
+
+from resource_usage import can_limit_memory, memory_limit
+from type_checker import TypeChecker
+
+
+# The range of limits searched, in megabytes. The search stops once the
+# ceiling is known to within RESOLUTION_MB.
+MIN_LIMIT_MB = 128
+MAX_LIMIT_MB = 64 * 1024
+RESOLUTION_MB = 16
+
+
+def _run_with_memory_limit(
+    type_checker: TypeChecker, test_files: Sequence[str], limit_mb: int | None
+) -> dict[str, str]:
+    # Hide the errors from runs that fail for lack of memory. This is a
+    # worker process that is discarded afterwards, so stderr isn't restored.
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), sys.stderr.fileno())
+
+    # Measure a full check rather than an incremental one, which needs
+    # much less memory.
+    type_checker.clear_cache()
+
+    with memory_limit(limit_mb, in_process=type_checker.runs_in_process):
+        return type_checker.run_tests(test_files)
+
+
+def _check_with_memory_limit(
+    type_checker: TypeChecker, test_files: Sequence[str], limit_mb: int | None
+) -> dict[str, str] | None:
+    """Run the type checker under the limit in a fresh worker process, so
+    that a limit applied in-process doesn't outlive the run. Returns None
+    if the type checker fails."""
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(
+                _run_with_memory_limit, type_checker, test_files, limit_mb
+            ).result()
+    except Exception:
+        # Running out of memory can surface as almost any error, or as
+        # the worker process being killed.
+        return None
+
+
+def find_memory_ceiling(
+    type_checker: TypeChecker, test_files: Sequence[str]
+) -> int | None:
+    """Return the smallest address space limit, in megabytes, under which
+    the type checker produces the same output as it does without a limit.
+    Returns None if there is no such limit up to MAX_LIMIT_MB.
+    """
+    if not can_limit_memory():
+        print("Memory limits are not supported on this platform")
+        return None
+
+    expected_output = _check_with_memory_limit(type_checker, test_files, None)
+    if expected_output is None:
+        print(f"{type_checker.name} failed without a memory limit")
+        return None
+
+    def succeeds(limit_mb: int) -> bool:
+        output = _check_with_memory_limit(type_checker, test_files, limit_mb)
+        result = "succeeded" if output == expected_output else "failed"
+        print(f"{type_checker.name} {result} with a {limit_mb}MB memory limit")
+        return output == expected_output
+
+    # Double the limit until the type checker succeeds, then narrow the
+    # gap between the largest failing and smallest succeeding limits.
+    lower_mb = 0
+    upper_mb = MIN_LIMIT_MB
+    while not succeeds(upper_mb):
+        if upper_mb >= MAX_LIMIT_MB:
+            return None
+        lower_mb = upper_mb
+        upper_mb *= 2
+
+    while upper_mb - lower_mb > RESOLUTION_MB:
+        limit_mb = (lower_mb + upper_mb) // 2
+        if succeeds(limit_mb):
+            upper_mb = limit_mb
+        else:
+            lower_mb = limit_mb
+
+    return upper_mb
@@ -10,6 +10,22 @@ from dataclasses import dataclass
 class _Options:
     report_only: bool | None
     skip_timing: bool
+    per_test_timing: bool
+    benchmark: int
+    warmups: int
+    memory_ceiling: bool
+    trace: str | None
+    performance_columns: bool
+    jobs: int
+    pytype_shards: int
+    force: bool
+    update_lock: bool
+    tests: list[str] | None
+    groups: list[str] | None
+    mypy_daemon: bool
+    pyright_server: bool
+    pyre_server: bool
+    watch: bool
 
 
 def parse_options(argv: list[str]) -> _Options:
@@ -25,5 +41,115 @@ def parse_options(argv: list[str]) -> _Options:
         action="store_true",
         help="do not update timing information in the output files",
     )
+    reporting_group.add_argument(
+        "--per-test-timing",
+        action="store_true",
+        help="record the time taken by each type checker for each test",
+    )
+    reporting_group.add_argument(
+        "--benchmark",
+        type=int,
+        default=0,
+        metavar="N",
+        help="run each type checker N more times and record statistics for the timings",
+    )
+    reporting_group.add_argument(
+        "--warmups",
+        type=int,
+        default=1,
+        metavar="N",
+        help="number of unmeasured runs before benchmarking (default: 1)",
+    )
+    reporting_group.add_argument(
+        "--memory-ceiling",
+        action="store_true",
+        help="search for the smallest memory limit under which each type checker "
+        "produces the same output",
+    )
+    reporting_group.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write a trace of where the test tool spends its time to FILE, "
+        "in Chrome's trace event format",
+    )
+    reporting_group.add_argument(
+        "--performance-columns",
+        action="store_true",
+        help="show each type checker's time and peak memory for each test in the "
+        "summary report, coloured relative to the fastest type checker",
+    )
+    running_group = parser.add_argument_group("running")
+    running_group.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of type checkers to run concurrently, each in its own process",
+    )
+    running_group.add_argument(
+        "--pytype-shards",
+        type=int,
+        default=1,
+        help="number of processes to split the test files across when running pytype",
+    )
+    running_group.add_argument(
+        "--force",
+        action="store_true",
+        help="ignore cached results and rerun every type checker on every test",
+    )
+    running_group.add_argument(
+        "--update-lock",
+        action="store_true",
+        help="pin each type checker in checkers.lock to its latest version "
+        "before installing it",
+    )
+    backend_group = parser.add_argument_group("backends")
+    backend_group.add_argument(
+        "--mypy-daemon",
+        action="store_true",
+        help="run mypy through a daemon that is kept running between runs",
+    )
+    backend_group.add_argument(
+        "--pyright-server",
+        action="store_true",
+        help="run pyright as a language server that is kept running between runs",
+    )
+    backend_group.add_argument(
+        "--pyre-server",
+        action="store_true",
+        help="run pyre as a server that is kept running between runs",
+    )
+    running_group.add_argument(
+        "--watch",
+        action="store_true",
+        help="rerun the affected tests whenever a file in the tests directory changes",
+    )
+    selection_group = parser.add_argument_group("test selection")
+    selection_group.add_argument(
+        "--test",
+        dest="tests",
+        action="append",
+        metavar="NAME",
+        help="run only this test (may be repeated)",
+    )
+    selection_group.add_argument(
+        "--group",
+        dest="groups",
+        action="append",
+        metavar="NAME",
+        help="run only the tests in this test group (may be repeated)",
+    )
     ret = _Options(**vars(parser.parse_args(argv)))
+    if ret.benchmark < 0 or ret.warmups < 0:
+        parser.error("--benchmark and --warmups must not be negative")
+    if ret.benchmark and ret.skip_timing:
+        parser.error("--benchmark cannot be combined with --skip-timing")
+    if ret.memory_ceiling and (ret.mypy_daemon or ret.pyright_server or ret.pyre_server):
+        parser.error(
+            "--memory-ceiling cannot be combined with --mypy-daemon, "
+            "--pyright-server or --pyre-server"
+        )
+    if ret.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if ret.pytype_shards < 1:
+        parser.error("--pytype-shards must be at least 1")
     return ret
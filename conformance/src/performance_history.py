@@ -0,0 +1,219 @@
+"""
+An append-only history of the time and memory each type checker takes,
+kept across runs so that slowdowns between versions of a type checker can
+be detected.
+
+Each timed run of a type checker appends an entry to
+".cache/performance_history.jsonl". Timings are only comparable on the
+same machine, so each entry records a fingerprint of the machine, and only
+entries with the same fingerprint are compared.
+"""
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import sys
+
+from benchmark import mann_whitney_greater, min_mann_whitney_greater
+
+
+# The significance level for a slowdown. It is divided between all of the
+# comparisons made for a run, so that testing each test separately doesn't
+# report slowdowns that are due to chance.
+SIGNIFICANCE_LEVEL = 0.05
+
+# A slowdown is only reported if the median time increased by at least
+# this factor, so that significant but negligible changes are ignored.
+MIN_SLOWDOWN = 1.1
+
+# The number of samples needed for each version before they are compared.
+# More are needed for a comparison to be able to reach the significance
+# level once it is divided between the comparisons; those that can't are
+# skipped.
+MIN_SAMPLES = 3
+
+
+def get_machine_fingerprint() -> str:
+    """
+    Returns a fingerprint of the hardware and Python version that timings
+    are measured with.
+    """
+    machine = [
+        platform.system(),
+        platform.machine(),
+        platform.processor(),
+        os.cpu_count(),
+        sys.version_info[:2],
+    ]
+    return hashlib.sha256(json.dumps(machine).encode()).hexdigest()[:16]
+
+
+@dataclass
+class PerformanceEntry:
+    # The name and version of the type checker.
+    checker: str
+    version: str
+
+    # The fingerprint of the machine the run was measured on.
+    machine: str
+
+    # The time of the run, in ISO 8601 format.
+    time: str
+
+    # The test files that were run, sorted by name. Times for the whole run
+    # are only compared between runs of the same tests.
+    tests: list[str]
+
+    # The wall time of each run of the type checker on all of the tests.
+    # There is more than one if the type checker was benchmarked.
+    wall_times: list[float]
+
+    # The peak memory used by the run, in MB, if it was measured.
+    peak_rss_mb: float | None = None
+
+    # The time taken for each test file, if per-test timing was enabled.
+    test_durations: dict[str, float] = field(default_factory=dict)
+
+    # The peak memory used for each test file, in MB, if it was measured.
+    test_peak_rss_mb: dict[str, float] = field(default_factory=dict)
+
+    @staticmethod
+    def get_current_time() -> str:
+        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+@dataclass
+class Regression:
+    # The test that slowed down, or None if the whole run slowed down.
+    test: str | None
+
+    # The version of the type checker that the run is compared with.
+    baseline_version: str
+
+    # The median times for the baseline version and the current version.
+    baseline_median: float
+    median: float
+
+    # The p-value of the comparison.
+    p_value: float
+
+    def describe(self) -> str:
+        return (
+            f"median {self.median:.2f}sec, up from {self.baseline_median:.2f}sec "
+            f"with {self.baseline_version} (p={self.p_value:.2g})"
+        )
+
+
+class PerformanceHistory:
+    """
+    The performance history of every type checker. Entries are added in
+    memory and appended to the history file when it is saved.
+    """
+
+    def __init__(self, history_file: Path) -> None:
+        self._history_file = history_file
+        self._entries: list[PerformanceEntry] = []
+        self._new_entries: list[PerformanceEntry] = []
+
+        try:
+            with open(history_file, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            try:
+                self._entries.append(PerformanceEntry(**json.loads(line)))
+            except (json.JSONDecodeError, TypeError):
+                # Skip entries that were only partly written or that have an
+                # older format.
+                continue
+
+    def append(self, entry: PerformanceEntry) -> None:
+        self._entries.append(entry)
+        self._new_entries.append(entry)
+
+    def save(self) -> None:
+        """
+        Appends the entries added since the history was last saved to the
+        history file.
+        """
+        if not self._new_entries:
+            return
+        self._history_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._history_file, "a") as f:
+            for entry in self._new_entries:
+                f.write(json.dumps(asdict(entry)) + "\n")
+        self._new_entries.clear()
+
+    def find_regressions(self, entry: PerformanceEntry) -> dict[str | None, Regression]:
+        """
+        Compares the timings of the version of the type checker in the entry
+        with those of the previous version measured on the same machine, and
+        returns any significant slowdowns. They are keyed by the name of the
+        test file that slowed down, or None if the whole run slowed down.
+        """
+        entries = [
+            e
+            for e in self._entries
+            if e.checker == entry.checker and e.machine == entry.machine
+        ]
+        baseline_version = next(
+            (e.version for e in reversed(entries) if e.version != entry.version), None
+        )
+        if baseline_version is None:
+            return {}
+        baseline_entries = [e for e in entries if e.version == baseline_version]
+        current_entries = [e for e in entries if e.version == entry.version]
+
+        # Collect the samples to compare for the whole run and for each test.
+        comparisons: dict[str | None, tuple[list[float], list[float]]] = {
+            None: (
+                [t for e in baseline_entries if e.tests == entry.tests for t in e.wall_times],
+                [t for e in current_entries if e.tests == entry.tests for t in e.wall_times],
+            )
+        }
+        for test in entry.test_durations:
+            comparisons[test] = (
+                [e.test_durations[test] for e in baseline_entries if test in e.test_durations],
+                [e.test_durations[test] for e in current_entries if test in e.test_durations],
+            )
+
+        # Skip the comparisons that have too few samples to ever be
+        # significant once the significance level is divided between them.
+        # Those with the fewest samples are skipped first, and each one that
+        # is skipped raises the level for the rest.
+        def get_min_p_value(samples: tuple[list[float], list[float]]) -> float:
+            baseline, current = samples
+            return min_mann_whitney_greater(len(current), len(baseline))
+
+        candidates = sorted(
+            (
+                (test, samples)
+                for test, samples in comparisons.items()
+                if min(len(samples[0]), len(samples[1])) >= MIN_SAMPLES
+            ),
+            key=lambda item: get_min_p_value(item[1]),
+        )
+        while candidates and (
+            get_min_p_value(candidates[-1][1]) >= SIGNIFICANCE_LEVEL / len(candidates)
+        ):
+            candidates.pop()
+        comparisons = dict(candidates)
+
+        regressions: dict[str | None, Regression] = {}
+        for compared_test, (baseline, current) in comparisons.items():
+            baseline_median = statistics.median(baseline)
+            median = statistics.median(current)
+            if median < baseline_median * MIN_SLOWDOWN:
+                continue
+            p_value = mann_whitney_greater(baseline, current)
+            if p_value < SIGNIFICANCE_LEVEL / len(comparisons):
+                regressions[compared_test] = Regression(
+                    compared_test, baseline_version, baseline_median, median, p_value
+                )
+        return regressions
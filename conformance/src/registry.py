@@ -0,0 +1,81 @@
+"""
+The registry of type checkers that are tested. The registry can be read
+without importing the type checker implementations, which is slow for
+some of them, so that reports can be generated quickly.
+
+Type checkers are listed in "type_checkers.toml" and can also be provided
+by installed packages through the "conformance.type_checkers" entry point
+group, where each entry point names a TypeChecker subclass.
+"""
+
+from dataclasses import dataclass, field
+import importlib
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Mapping, Sequence
+
+import tomli
+
+if TYPE_CHECKING:
+    from type_checker import TypeChecker
+
+
+ENTRY_POINT_GROUP = "conformance.type_checkers"
+
+# The implementation used for type checkers that are registered with a
+# command rather than an implementation.
+COMMAND_IMPLEMENTATION = "type_checker:CommandTypeChecker"
+
+
+@dataclass(frozen=True)
+class TypeCheckerInfo:
+    # The name of the type checker, which is also the name of the
+    # directory its results are stored in.
+    name: str
+
+    # The class that implements the type checker, as "module:ClassName".
+    implementation: str
+
+    # The keyword arguments used to create the implementation.
+    options: Mapping[str, Any] = field(default_factory=dict)
+
+    def get_results_dir(self, root_dir: Path) -> Path:
+        return root_dir / "results" / self.name
+
+    def create(self) -> "TypeChecker":
+        """
+        Imports the implementation of the type checker and returns an
+        instance of it.
+        """
+        module_name, class_name = self.implementation.split(":")
+        type_checker_class = getattr(importlib.import_module(module_name), class_name)
+        return type_checker_class(**self.options)
+
+
+def get_registered_type_checkers(root_dir: Path) -> Sequence[TypeCheckerInfo]:
+    # Read the TOML file that lists the type checkers, in the order
+    # they appear in the summary report.
+    registry_file = root_dir / "src" / "type_checkers.toml"
+    with open(registry_file, "rb") as f:
+        registry = tomli.load(f)
+
+    type_checkers: list[TypeCheckerInfo] = []
+    for name, entry in registry.items():
+        entry = dict(entry)
+        if "implementation" in entry:
+            implementation = entry.pop("implementation")
+        else:
+            implementation = COMMAND_IMPLEMENTATION
+            entry["name"] = name
+        type_checkers.append(TypeCheckerInfo(name, implementation, entry))
+
+    # Add any type checkers provided by installed packages. A type checker
+    # listed in the TOML file takes precedence over one with the same name.
+    from importlib.metadata import entry_points
+
+    registered_names = {type_checker.name for type_checker in type_checkers}
+    for entry_point in sorted(entry_points(group=ENTRY_POINT_GROUP), key=lambda e: e.name):
+        if entry_point.name not in registered_names:
+            type_checkers.append(TypeCheckerInfo(entry_point.name, entry_point.value))
+            registered_names.add(entry_point.name)
+
+    return type_checkers
@@ -1,59 +1,171 @@
 """
 Generates a summary of the type checker conformant tests.
+
+The summary is regenerated only when its inputs have changed. Each row of
+the summary table is rendered from the inputs that affect it, and the HTML
+for each row is cached in ".cache/report.json" under a fingerprint of those
+inputs, so only the rows whose results changed are rendered again.
 """
 
+import hashlib
+import json
+import math
 from pathlib import Path
+from typing import Any, Callable, Sequence
 
-import tomli
-
+from registry import get_registered_type_checkers
+from results_model import ResultsModel
+from results_store import TestResult
 from test_groups import get_test_cases, get_test_groups
-from type_checker import TYPE_CHECKERS
 
 
-def generate_summary(root_dir: Path):
-    print("Generating summary report")
+# A part of the summary table: either HTML that is cheap to produce, or
+# the fingerprint of the inputs to a row with a function that renders it.
+_SummaryPart = str | tuple[str, Callable[[], str]]
+
+
+# Times are compared against at least this many seconds, so that tests that
+# take almost no time don't show large differences.
+MIN_COMPARED_DURATION = 0.01
+
+# A test that takes this many times as long as it does for the fastest type
+# checker, or longer, is shown in the darkest colour of the heatmap.
+MAX_HEATMAP_SLOWDOWN = 8.0
+
+
+def _get_fingerprint(*inputs: Any) -> str:
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+class ReportCache:
+    """
+    The fingerprint of the inputs to the report that was last written,
+    and the HTML of each row in it, keyed by the fingerprint of its inputs.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self._cache_file = cache_file
+        self._fingerprint: str | None = None
+        self._report_stat: list[int] | None = None
+        self._fragments: dict[str, str] = {}
+        self._used_fragments: dict[str, str] = {}
+
+        # The cached HTML is only valid for the code that rendered it.
+        self._generator = _get_fingerprint(Path(__file__).read_text())
+
+        try:
+            with open(cache_file, "r") as f:
+                cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if cache.get("generator") == self._generator:
+            self._fingerprint = cache["fingerprint"]
+            self._report_stat = cache["report_stat"]
+            self._fragments = cache["fragments"]
+
+    def is_current(self, fingerprint: str, report_file: Path) -> bool:
+        """
+        Returns whether the report was written from inputs with the given
+        fingerprint and hasn't been changed since.
+        """
+        try:
+            stat = report_file.stat()
+        except FileNotFoundError:
+            return False
+        return fingerprint == self._fingerprint and self._report_stat == [
+            stat.st_mtime_ns,
+            stat.st_size,
+        ]
+
+    def get_fragment(self, fingerprint: str, render: Callable[[], str]) -> str:
+        """
+        Returns the cached HTML for inputs with the given fingerprint,
+        rendering it if it isn't cached.
+        """
+        fragment = self._fragments.get(fingerprint)
+        if fragment is None:
+            fragment = render()
+        self._used_fragments[fingerprint] = fragment
+        return fragment
+
+    def save(self, fingerprint: str, report_file: Path) -> None:
+        """
+        Records that the report was written from inputs with the given
+        fingerprint. Only the fragments used in the report are kept.
+        """
+        stat = report_file.stat()
+        self._cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._cache_file, "w") as f:
+            json.dump(
+                {
+                    "generator": self._generator,
+                    "fingerprint": fingerprint,
+                    "report_stat": [stat.st_mtime_ns, stat.st_size],
+                    "fragments": self._used_fragments,
+                },
+                f,
+            )
+
+
+def generate_summary(
+    root_dir: Path, results: ResultsModel, performance_columns: bool = False
+):
     template_file = root_dir / "src" / "results_template.html"
     with open(template_file, "r") as f:
         template = f.read()
 
-    summary = template.replace("{{summary}}", generate_summary_html(root_dir))
-
     results_file = root_dir / "results" / "results.html"
+    report_cache = ReportCache(root_dir / ".cache" / "report.json")
+
+    # The summary depends on the template, the test groups and the results,
+    # all of which are covered by the fingerprints of the parts.
+    parts = get_summary_parts(root_dir, results, performance_columns)
+    fingerprint = _get_fingerprint(
+        template, [part if isinstance(part, str) else part[0] for part in parts]
+    )
+    if report_cache.is_current(fingerprint, results_file):
+        print("Summary report is up to date")
+        return
+
+    print("Generating summary report")
+    summary_html = "\n".join(
+        part if isinstance(part, str) else report_cache.get_fragment(*part)
+        for part in parts
+    )
+    summary = template.replace("{{summary}}", summary_html)
 
     with open(results_file, "w") as f:
         f.write(summary)
+    report_cache.save(fingerprint, results_file)
+
 
+def get_summary_parts(
+    root_dir: Path, results: ResultsModel, performance_columns: bool = False
+) -> list[_SummaryPart]:
+    """
+    Returns the parts of the summary table, with the rows that are slow to
+    render given as the fingerprint of their inputs and a function that
+    renders them.
 
-def generate_summary_html(root_dir: Path) -> str:
-    column_count = len(TYPE_CHECKERS) + 1
+    If performance_columns is true, each type checker has a second column
+    with its time and peak memory for each test, and each test group ends
+    with a row of subtotals.
+    """
+    type_checkers = get_registered_type_checkers(root_dir)
+    columns_per_checker = 2 if performance_columns else 1
+    column_count = len(type_checkers) * columns_per_checker + 1
     test_groups = get_test_groups(root_dir)
     test_cases = get_test_cases(test_groups, root_dir / "tests")
 
-    summary_html = ['<div class="table_container"><table><tbody>']
-    summary_html.append('<tr><th class="col1">&nbsp;</th>')
-
-    for type_checker in TYPE_CHECKERS:
-        # Load the version file for the type checker.
-        version_file = root_dir / "results" / type_checker.name / "version.toml"
-
-        try:
-            with open(version_file, "rb") as f:
-                existing_info = tomli.load(f)
-        except FileNotFoundError:
-            existing_info = {}
-        except tomli.TOMLDecodeError:
-            print(f"Error decoding {version_file}")
-            existing_info = {}
-
-        version = existing_info["version"] or "Unknown version"
-        test_duration = existing_info.get("test_duration")
-
-        summary_html.append(f"<th class='tc-header'><div class='tc-name'>{version}</div>")
-        if test_duration is not None:
-            summary_html.append(f"<div class='tc-time'>{test_duration:.1f}sec</div>")
-        summary_html.append("</th>")
+    summary_parts: list[_SummaryPart] = ['<div class="table_container"><table><tbody>']
 
-    summary_html.append("</tr>")
+    checker_info = [results.get_info(type_checker.name) for type_checker in type_checkers]
+    summary_parts.append(
+        (
+            _get_fingerprint("header", checker_info, performance_columns),
+            lambda: render_header_row(checker_info, performance_columns),
+        )
+    )
 
     for test_group_name, test_group in test_groups.items():
         tests_in_group = [
@@ -64,56 +176,215 @@ def generate_summary_html(root_dir: Path) -> str:
 
         # Are there any test cases in this group?
         if len(tests_in_group) > 0:
-            summary_html.append(f'<tr><th class="column" colspan="{column_count}">')
-            summary_html.append(
+            summary_parts.append(f'<tr><th class="column" colspan="{column_count}">')
+            summary_parts.append(
                 f'<a class="test_group" href="{test_group.href}">{test_group.name}</a>'
             )
-            summary_html.append("</th></tr>")
+            summary_parts.append("</th></tr>")
 
+            group_results: list[list[TestResult]] = []
             for test_case in tests_in_group:
-                test_case_name = test_case.stem
-
-                summary_html.append(f'<tr><th class="column col1">&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;{test_case_name}</th>')
-
-                for type_checker in TYPE_CHECKERS:
-                    try:
-                        results_file = (
-                            root_dir
-                            / "results"
-                            / type_checker.name
-                            / f"{test_case_name}.toml"
-                        )
-                        with open(results_file, "rb") as f:
-                            results = tomli.load(f)
-                    except FileNotFoundError:
-                        results = {}
-
-                    raw_notes = results.get("notes", "").strip()
-                    conformance = results.get("conformant", "Unknown")
-                    notes = "".join(
-                        [f"<p>{note}</p>" for note in raw_notes.split("\n")]
-                    )
-
-                    conformance_class = (
-                        "conformant"
-                        if conformance == "Pass"
-                        else "partially-conformant"
-                        if conformance == "Partial"
-                        else "not-conformant"
-                    )
-
-                    # Add an asterisk if there are notes to display for a "Pass".
-                    if raw_notes != "" and conformance == "Pass":
-                        conformance = "Pass*"
-
-                    conformance_cell = f"{conformance}"
-                    if raw_notes != "":
-                        conformance_cell = f'<div class="hover-text">{conformance_cell}<span class="tooltip-text" id="bottom">{notes}</span></div>'
-
-                    summary_html.append(f'<th class="column col2 {conformance_class}">{conformance_cell}</th>')
-
-                summary_html.append("</tr>")
-
-    summary_html.append("</tbody></table></div>\n")
+                test_results = [
+                    results.get_result(type_checker.name, test_case.stem)
+                    or TestResult(test_case.stem, "")
+                    for type_checker in type_checkers
+                ]
+                group_results.append(test_results)
+                summary_parts.append(
+                    get_test_row(test_case.stem, test_results, performance_columns)
+                )
+
+            if performance_columns:
+                summary_parts.append(render_subtotal_row(group_results))
+
+    summary_parts.append("</tbody></table></div>\n")
+
+    return summary_parts
+
+
+def get_test_row(
+    test_case_name: str, test_results: Sequence[TestResult], performance_columns: bool
+) -> tuple[str, Callable[[], str]]:
+    fingerprint = _get_fingerprint(
+        "test",
+        test_case_name,
+        [
+            [result.conformant, result.notes, result.test_duration, result.peak_rss_mb]
+            for result in test_results
+        ],
+        performance_columns,
+    )
+    return fingerprint, lambda: render_test_row(
+        test_case_name, test_results, performance_columns
+    )
+
+
+def get_heatmap_color(slowdown: float) -> str:
+    """
+    Returns the background colour for a time that is the given multiple of
+    the fastest time, from green for the fastest to red.
+    """
+    position = math.log(max(slowdown, 1.0)) / math.log(MAX_HEATMAP_SLOWDOWN)
+    hue = 120 * (1 - min(position, 1.0))
+    return f"hsl({hue:.0f}, 70%, 80%)"
+
+
+def render_performance_cell(
+    duration: float | None, peak_rss_mb: float | None, fastest_duration: float | None
+) -> str:
+    if duration is None and peak_rss_mb is None:
+        return '<th class="column perf">&ndash;</th>'
+
+    lines: list[str] = []
+    attributes = ""
+    if duration is not None:
+        lines.append(f"{duration:.2f}sec")
+        if fastest_duration is not None:
+            slowdown = max(duration, MIN_COMPARED_DURATION) / max(
+                fastest_duration, MIN_COMPARED_DURATION
+            )
+            attributes = (
+                f' style="background-color: {get_heatmap_color(slowdown)}"'
+                f' title="{slowdown:.1f}x the fastest type checker"'
+            )
+    if peak_rss_mb is not None:
+        lines.append(f"{peak_rss_mb:.0f}MB")
+    return f'<th class="column perf"{attributes}>{"<br>".join(lines)}</th>'
+
+
+def render_subtotal_row(group_results: Sequence[Sequence[TestResult]]) -> str:
+    """
+    Returns a row with the number of tests each type checker passes in a
+    test group, its total time for the group and its peak memory.
+    """
+    checker_results = list(zip(*group_results))
+
+    # The total time is only shown if every test in the group was timed.
+    total_durations: list[float | None] = []
+    for results in checker_results:
+        if all(result.test_duration is not None for result in results):
+            total_durations.append(sum(result.test_duration or 0.0 for result in results))
+        else:
+            total_durations.append(None)
+    recorded_durations = [d for d in total_durations if d is not None]
+    fastest_duration = min(recorded_durations) if recorded_durations else None
+
+    summary_html = [
+        '<tr><th class="column col1 subtotal">&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;Subtotal</th>'
+    ]
+    for results, total_duration in zip(checker_results, total_durations):
+        passed = sum(result.conformant == "Pass" for result in results)
+        summary_html.append(
+            f'<th class="column col2 subtotal">{passed}/{len(results)} Pass</th>'
+        )
+        peak_values = [r.peak_rss_mb for r in results if r.peak_rss_mb is not None]
+        summary_html.append(
+            render_performance_cell(
+                total_duration, max(peak_values) if peak_values else None, fastest_duration
+            )
+        )
+    summary_html.append("</tr>")
+
+    return "\n".join(summary_html)
+
+
+def render_header_row(
+    checker_info: Sequence[dict[str, Any]], performance_columns: bool = False
+) -> str:
+    summary_html = ['<tr><th class="col1">&nbsp;</th>']
+
+    for existing_info in checker_info:
+        version = existing_info.get("version") or "Unknown version"
+        test_duration = existing_info.get("test_duration")
+        benchmark = existing_info.get("benchmark")
+
+        colspan = " colspan='2'" if performance_columns else ""
+        summary_html.append(
+            f"<th class='tc-header'{colspan}><div class='tc-name'>{version}</div>"
+        )
+        if benchmark is not None:
+            # Show the median of repeated runs with an error bar of one
+            # standard deviation, and the full statistics on hover.
+            title = (
+                f"{benchmark['runs']} runs: "
+                f"min {benchmark['wall_min']:.2f}sec, "
+                f"p95 {benchmark['wall_p95']:.2f}sec, "
+                f"median CPU {benchmark['cpu_median']:.2f}sec"
+            )
+            summary_html.append(
+                f"<div class='tc-time' title='{title}'>{benchmark['wall_median']:.1f}"
+                f" &plusmn; {benchmark['wall_stddev']:.1f}sec</div>"
+            )
+        elif test_duration is not None:
+            summary_html.append(f"<div class='tc-time'>{test_duration:.1f}sec</div>")
+        resource_usage = existing_info.get("resource_usage")
+        if resource_usage is not None:
+            title = (
+                f"user CPU {resource_usage['user_time']:.2f}sec, "
+                f"system CPU {resource_usage['system_time']:.2f}sec, "
+                f"{resource_usage['voluntary_context_switches']} voluntary and "
+                f"{resource_usage['involuntary_context_switches']} involuntary "
+                "context switches"
+            )
+            summary_html.append(
+                f"<div class='tc-time' title='{title}'>"
+                f"{resource_usage['peak_rss_mb']:.0f}MB</div>"
+            )
+        summary_html.append("</th>")
+
+    summary_html.append("</tr>")
+
+    return "\n".join(summary_html)
+
+
+def render_test_row(
+    test_case_name: str,
+    test_results: Sequence[TestResult],
+    performance_columns: bool = False,
+) -> str:
+    summary_html = [f'<tr><th class="column col1">&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;{test_case_name}</th>']
+
+    durations = [r.test_duration for r in test_results if r.test_duration is not None]
+    fastest_duration = min(durations) if durations else None
+
+    for result in test_results:
+        raw_notes = (result.notes or "").strip()
+        conformance = result.conformant or "Unknown"
+        notes = "".join(
+            [f"<p>{note}</p>" for note in raw_notes.split("\n")]
+        )
+
+        conformance_class = (
+            "conformant"
+            if conformance == "Pass"
+            else "partially-conformant"
+            if conformance == "Partial"
+            else "not-conformant"
+        )
+
+        # Add an asterisk if there are notes to display for a "Pass".
+        if raw_notes != "" and conformance == "Pass":
+            conformance = "Pass*"
+
+        conformance_cell = f"{conformance}"
+        if raw_notes != "":
+            conformance_cell = f'<div class="hover-text">{conformance_cell}<span class="tooltip-text" id="bottom">{notes}</span></div>'
+
+        # Show the time taken for the test, if recorded, on hover.
+        test_duration = result.test_duration
+        title = (
+            f' title="{test_duration:.2f}sec"' if test_duration is not None else ""
+        )
+
+        summary_html.append(f'<th class="column col2 {conformance_class}"{title}>{conformance_cell}</th>')
+
+        if performance_columns:
+            summary_html.append(
+                render_performance_cell(
+                    result.test_duration, result.peak_rss_mb, fastest_duration
+                )
+            )
+
+    summary_html.append("</tr>")
 
     return "\n".join(summary_html)
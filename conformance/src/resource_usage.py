@@ -0,0 +1,250 @@
+"""
+Measures the memory and CPU used by type checker runs.
+"""
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import os
+from subprocess import CompletedProcess, Popen
+import sys
+from threading import Event, Thread
+from types import ModuleType
+from typing import Any, Callable, Iterator, Sequence
+
+resource: ModuleType | None
+try:
+    import resource
+except ImportError:
+    # The resource module isn't available on Windows.
+    resource = None
+
+
+@dataclass
+class ResourceUsage:
+    peak_rss_mb: float = 0.0
+    user_time: float = 0.0
+    system_time: float = 0.0
+    voluntary_context_switches: int = 0
+    involuntary_context_switches: int = 0
+
+    def add(self, other: "ResourceUsage", concurrent: bool = False) -> None:
+        """Add the resources used by another run. If the runs were concurrent,
+        their peak memory is added; otherwise the larger peak is kept."""
+        if concurrent:
+            self.peak_rss_mb += other.peak_rss_mb
+        else:
+            self.peak_rss_mb = max(self.peak_rss_mb, other.peak_rss_mb)
+        self.user_time += other.user_time
+        self.system_time += other.system_time
+        self.voluntary_context_switches += other.voluntary_context_switches
+        self.involuntary_context_switches += other.involuntary_context_switches
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            key: round(value, 2) if isinstance(value, float) else value
+            for key, value in asdict(self).items()
+        }
+
+
+# The usage being collected by the innermost track_resource_usage block.
+_tracked_usage: list[ResourceUsage] = []
+
+# The address space limit, in bytes, applied to commands run with
+# run_with_usage, or None if they are not limited.
+_memory_limit: int | None = None
+
+
+@contextmanager
+def track_resource_usage() -> Iterator[ResourceUsage]:
+    """Collect the resources used within the block by commands run with
+    run_with_usage and by work measured with measure_in_process. Blocks can
+    be nested, in which case the inner usage is also added to the outer."""
+    usage = ResourceUsage()
+    _tracked_usage.append(usage)
+    try:
+        yield usage
+    finally:
+        _tracked_usage.pop()
+        if _tracked_usage:
+            _tracked_usage[-1].add(usage)
+
+
+def record_resource_usage(usage: ResourceUsage, concurrent: bool = False) -> None:
+    """Add usage measured elsewhere, such as in a worker process, to the
+    innermost track_resource_usage block."""
+    if _tracked_usage:
+        _tracked_usage[-1].add(usage, concurrent=concurrent)
+
+
+def can_limit_memory() -> bool:
+    return resource is not None
+
+
+@contextmanager
+def memory_limit(limit_mb: int | None, in_process: bool = False) -> Iterator[None]:
+    """Limit the address space available to commands run with run_with_usage
+    within the block. If in_process is true, the limit is instead applied to
+    this process (and so to any processes it starts) for type checkers that
+    run in-process."""
+    global _memory_limit
+
+    if limit_mb is None or resource is None:
+        yield
+        return
+
+    limit = limit_mb * 1024 * 1024
+    if not in_process:
+        previous_limit = _memory_limit
+        _memory_limit = limit
+        try:
+            yield
+        finally:
+            _memory_limit = previous_limit
+        return
+
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (_clamp_limit(limit, hard_limit), hard_limit))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft_limit, hard_limit))
+
+
+def _apply_memory_limit() -> None:
+    # This runs in the child process before the command is started.
+    assert resource is not None and _memory_limit is not None
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(
+        resource.RLIMIT_AS, (_clamp_limit(_memory_limit, hard_limit), hard_limit)
+    )
+
+
+def _clamp_limit(limit: int, hard_limit: int) -> int:
+    # The soft limit can't be raised above the hard limit.
+    assert resource is not None
+    if hard_limit == resource.RLIM_INFINITY:
+        return limit
+    return min(limit, hard_limit)
+
+
+def _maxrss_to_mb(maxrss: int) -> float:
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == "darwin":
+        return maxrss / (1024 * 1024)
+    return maxrss / 1024
+
+
+def run_with_usage(
+    command: Sequence[str],
+    check: bool = False,
+    on_line: Callable[[str], None] | None = None,
+    **kwargs: Any,
+) -> CompletedProcess:
+    """Run a command like subprocess.run, recording the resources used by the
+    process (and any processes it waited for) with os.wait4. The command is
+    run under the limit set by any enclosing memory_limit block.
+
+    If on_line is given, each line of stdout is passed to it as soon as it
+    is read instead of being collected, so output can be processed while
+    the command is still running.
+    """
+    if _memory_limit is not None:
+        kwargs["preexec_fn"] = _apply_memory_limit
+
+    with Popen(command, **kwargs) as proc:
+        pipes = {"stdout": proc.stdout, "stderr": proc.stderr}
+        if on_line is not None:
+            del pipes["stdout"]
+
+        # Read the other pipes on separate threads so that none fills up.
+        output: dict[str, Any] = {}
+        readers = [
+            Thread(target=lambda name=name, pipe=pipe: output.update({name: pipe.read()}))
+            for name, pipe in pipes.items()
+            if pipe is not None
+        ]
+        for reader in readers:
+            reader.start()
+        if on_line is not None:
+            stdout = proc.stdout
+            assert stdout is not None, "on_line requires stdout=PIPE"
+            for line in stdout:
+                on_line(line)
+        for reader in readers:
+            reader.join()
+
+        if hasattr(os, "wait4"):
+            _, status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            record_resource_usage(
+                ResourceUsage(
+                    peak_rss_mb=_maxrss_to_mb(rusage.ru_maxrss),
+                    user_time=rusage.ru_utime,
+                    system_time=rusage.ru_stime,
+                    voluntary_context_switches=rusage.ru_nvcsw,
+                    involuntary_context_switches=rusage.ru_nivcsw,
+                )
+            )
+        else:
+            proc.wait()
+
+    completed = CompletedProcess(
+        proc.args, proc.returncode, output.get("stdout"), output.get("stderr")
+    )
+    if check:
+        completed.check_returncode()
+    return completed
+
+
+def _get_current_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+@contextmanager
+def measure_in_process(sample_interval: float = 0.05) -> Iterator[None]:
+    """Record the resources used by work done in this process within the
+    block. Peak memory is found by sampling the resident set size on a
+    background thread, falling back to the process's peak if the current
+    size can't be read."""
+    if resource is None:
+        yield
+        return
+
+    peak_rss_mb = 0.0
+    stop = Event()
+
+    def sample() -> None:
+        nonlocal peak_rss_mb
+        while True:
+            rss_mb = _get_current_rss_mb()
+            if rss_mb is not None:
+                peak_rss_mb = max(peak_rss_mb, rss_mb)
+            if stop.wait(sample_interval):
+                break
+
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    sampler = Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        if not peak_rss_mb:
+            peak_rss_mb = _maxrss_to_mb(after.ru_maxrss)
+
+        record_resource_usage(
+            ResourceUsage(
+                peak_rss_mb=peak_rss_mb,
+                user_time=after.ru_utime - before.ru_utime,
+                system_time=after.ru_stime - before.ru_stime,
+                voluntary_context_switches=after.ru_nvcsw - before.ru_nvcsw,
+                involuntary_context_switches=after.ru_nivcsw - before.ru_nivcsw,
+            )
+        )
@@ -0,0 +1,62 @@
+"""
+A content-addressed cache of type checker output for each test case.
+
+A cached output is keyed on the contents of the test file and the
+helper modules it imports along with the name, version and options
+of the type checker. If none of these have changed, the type checker
+does not need to be run on that test case again.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+from dependencies import get_helper_files
+from tracing import span
+from type_checker import TypeChecker
+
+
+# Bump this if the format of the cached output changes.
+CACHE_FORMAT_VERSION = 1
+
+
+def _hash_file(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class ResultCache:
+    """
+    Stores the output of one type checker for individual test cases.
+    """
+
+    def __init__(self, cache_dir: Path, type_checker: TypeChecker) -> None:
+        self._cache_dir = cache_dir / "results" / type_checker.name
+        with span("get_version", type_checker=type_checker.name):
+            version = type_checker.get_version()
+        self._checker_key = [
+            CACHE_FORMAT_VERSION,
+            type_checker.name,
+            version,
+            list(type_checker.get_options()),
+        ]
+
+    def get_key(self, test_case: Path) -> str:
+        key = [
+            *self._checker_key,
+            _hash_file(test_case),
+            [(p.name, _hash_file(p)) for p in get_helper_files(test_case)],
+        ]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def get(self, test_case: Path) -> str | None:
+        """Return the cached output for a test case, or None if there is none."""
+        cache_file = self._cache_dir / f"{self.get_key(test_case)}.txt"
+        try:
+            return cache_file.read_bytes().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, test_case: Path, output: str) -> None:
+        cache_file = self._cache_dir / f"{self.get_key(test_case)}.txt"
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_bytes(output.encode("utf-8"))
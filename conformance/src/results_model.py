@@ -0,0 +1,144 @@
+"""
+The results of every type checker, loaded once and shared by running the
+tests and generating the summary report.
+
+The results are loaded from the results store when the test tool starts.
+Running the tests updates them in memory, the report is generated from
+them, and the changes are written to the store and exported to the results
+files together when they are saved. The performance history of each type
+checker is loaded and saved along with the results.
+
+The results files may be edited by hand while the tool is running, for
+example to add "ignore_errors" in watch mode, so any that changed on disk
+are reloaded before the results of a run are recorded and again before
+they are saved.
+"""
+
+from dataclasses import replace
+from pathlib import Path
+from typing import Any
+
+from performance_history import PerformanceHistory
+from results_store import ResultsStore, TestResult
+from tracing import span
+
+
+# The fields of a result that are edited by hand in its results file. These
+# are always taken from the file, even if the result was updated by a run.
+MANUAL_FIELDS = ("conformant", "notes", "ignore_errors")
+
+
+class ResultsModel:
+    """
+    The latest results and version information of each type checker.
+    """
+
+    def __init__(self, root_dir: Path) -> None:
+        self._root_dir = root_dir
+        with span("load_results"), ResultsStore(root_dir) as store:
+            self._info = store.get_all_info()
+            self._results = store.get_all_results()
+
+        # The time and memory each type checker took in earlier runs.
+        self.history = PerformanceHistory(root_dir / ".cache" / "performance_history.jsonl")
+
+        # The type checkers whose version information has changed since the
+        # results were last saved.
+        self._changed_info: set[str] = set()
+
+        # The results that have been updated since they were last saved,
+        # keyed by type checker and test, with whether they have changed
+        # and must be exported to the results file.
+        self._updated_results: dict[tuple[str, str], bool] = {}
+
+    def get_checkers(self) -> list[str]:
+        """
+        Returns the names of the type checkers that have results.
+        """
+        return sorted(self._results)
+
+    def get_info(self, checker: str) -> dict[str, Any]:
+        """
+        Returns the version and timings of the latest run of a type checker,
+        as recorded in its version file.
+        """
+        return dict(self._info.get(checker, {}))
+
+    def put_info(self, checker: str, info: dict[str, Any]) -> None:
+        self._info[checker] = info
+        self._changed_info.add(checker)
+
+    def get_result(self, checker: str, test: str) -> TestResult | None:
+        """
+        Returns the latest results of a type checker for a test, or None if
+        there are none.
+        """
+        return self._results.get(checker, {}).get(test)
+
+    def get_results(self, checker: str) -> dict[str, TestResult]:
+        """
+        Returns the latest results of a type checker for each test, keyed
+        by the name of the test.
+        """
+        return self._results.get(checker, {})
+
+    def put_result(self, checker: str, result: TestResult, changed: bool = True) -> None:
+        """
+        Updates the results of a type checker for a test. If changed is true,
+        they are written to the results file when the results are saved.
+        """
+        self._results.setdefault(checker, {})[result.test] = result
+        key = (checker, result.test)
+        self._updated_results[key] = self._updated_results.get(key, False) or changed
+
+    def reload(self) -> None:
+        """
+        Reloads any results and version files that were changed on disk
+        since the results were loaded or last saved.
+        """
+        with span("reload_results"), ResultsStore(self._root_dir) as store:
+            self._apply_imported_files(store)
+
+    def save(self) -> None:
+        """
+        Writes the results that were updated since they were last saved to
+        the store, and exports those that changed to the results files. Any
+        results files that were changed on disk are reloaded first, so that
+        edits to them aren't overwritten.
+        """
+        self.history.save()
+
+        with span("save_results"), ResultsStore(self._root_dir) as store:
+            self._apply_imported_files(store)
+            if not self._changed_info and not self._updated_results:
+                return
+
+            for checker in self._changed_info:
+                store.put_info(checker, self._info[checker])
+            for (checker, test), changed in self._updated_results.items():
+                store.put_result(checker, self._results[checker][test], changed)
+            store.export()
+
+        self._changed_info.clear()
+        self._updated_results.clear()
+
+    def _apply_imported_files(self, store: ResultsStore) -> None:
+        # Version files are only taken from disk if the version information
+        # wasn't updated since it was last saved.
+        for checker in store.imported_info:
+            if checker not in self._changed_info:
+                self._info[checker] = store.get_info(checker)
+
+        # A result that was updated by a run keeps its output, but takes the
+        # fields that are edited by hand from the file.
+        for checker, test in store.imported_results:
+            result = store.get_result(checker, test)
+            assert result is not None
+            existing = self.get_result(checker, test)
+            if existing is not None and (checker, test) in self._updated_results:
+                result = replace(
+                    existing,
+                    key_order=result.key_order,
+                    **{name: getattr(result, name) for name in MANUAL_FIELDS},
+                )
+            self._results.setdefault(checker, {})[test] = result
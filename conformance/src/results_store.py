@@ -0,0 +1,449 @@
+"""
+An indexed store of the results of the conformance tests.
+
+The results are kept in a SQLite database in ".cache/results.db", keyed by
+the type checker, its version and the test. The test tool reads and updates
+results through the store, so finding the results for a test is an indexed
+lookup rather than a parse of its results file.
+
+The TOML files in the "results" directory are an export of the latest
+results for each type checker, which is written for the results that
+changed. They are also where results are reviewed and annotated with
+"conformant", "notes" and "ignore_errors", so any results file that changed
+on disk since it was last seen is imported back into the store when it is
+opened.
+"""
+
+from dataclasses import dataclass, field
+import json
+from pathlib import Path
+import sqlite3
+from time import time_ns
+from typing import Any
+
+import tomli
+import tomlkit
+import tomlkit.items
+
+
+# Bump this if the schema changes. The store is rebuilt from the results
+# files when it has a different version.
+SCHEMA_VERSION = 2
+
+# The keys that are written as multiline strings in the results files.
+MULTILINE_KEYS = ("notes", "output", "errors_diff")
+
+# The order of the keys in a new results file.
+DEFAULT_KEY_ORDER = (
+    "conformant",
+    "notes",
+    "output",
+    "conformance_automated",
+    "errors_diff",
+    "ignore_errors",
+    "test_duration",
+    "peak_rss_mb",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    checker TEXT NOT NULL,
+    version TEXT NOT NULL,
+    test TEXT NOT NULL,
+    conformant TEXT,
+    conformance_automated TEXT,
+    notes TEXT,
+    ignore_errors TEXT,
+    output TEXT NOT NULL,
+    errors_diff TEXT NOT NULL,
+    test_duration REAL,
+    peak_rss_mb REAL,
+    key_order TEXT NOT NULL,
+    updated INTEGER NOT NULL,
+    exported INTEGER NOT NULL,
+    PRIMARY KEY (checker, version, test)
+);
+CREATE INDEX IF NOT EXISTS results_latest ON results (checker, test, updated);
+CREATE TABLE IF NOT EXISTS checkers (
+    checker TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    exported INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+# Selects the latest results of each type checker for each test.
+_LATEST_RESULTS = """
+SELECT checker, test, version, conformant, conformance_automated, notes,
+    ignore_errors, output, errors_diff, test_duration, peak_rss_mb, key_order
+FROM results AS r
+WHERE updated = (
+    SELECT MAX(updated) FROM results WHERE checker = r.checker AND test = r.test
+)
+"""
+
+
+@dataclass
+class TestResult:
+    # The name of the test, without the ".py" extension.
+    test: str
+
+    # The version of the type checker that produced the output.
+    version: str
+
+    # The manually assessed conformance, such as "Pass" or "Partial".
+    conformant: str | None = None
+
+    # "Pass" if the output matches the errors expected by the test.
+    conformance_automated: str | None = None
+
+    # Notes that explain a conformance that isn't "Pass".
+    notes: str | None = None
+
+    # Errors that aren't counted when comparing against the expected errors.
+    ignore_errors: list[str] | None = None
+
+    # The output of the type checker for the test.
+    output: str = ""
+
+    # The differences between the expected and reported errors.
+    errors_diff: str = ""
+
+    # The time taken by the type checker for the test, if recorded.
+    test_duration: float | None = None
+
+    # The peak memory used by the type checker for the test, in MB, if
+    # recorded.
+    peak_rss_mb: float | None = None
+
+    # The order of the keys in the results file, so that exporting the
+    # results doesn't reorder them.
+    key_order: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_toml(cls, test: str, version: str, results: dict[str, Any]) -> "TestResult":
+        return cls(
+            test=test,
+            version=version,
+            conformant=results.get("conformant"),
+            conformance_automated=results.get("conformance_automated"),
+            notes=results.get("notes"),
+            ignore_errors=results.get("ignore_errors"),
+            output=results.get("output", ""),
+            errors_diff=results.get("errors_diff", ""),
+            test_duration=results.get("test_duration"),
+            peak_rss_mb=results.get("peak_rss_mb"),
+            key_order=list(results),
+        )
+
+    def to_toml(self) -> tomlkit.TOMLDocument:
+        values = {
+            "conformant": self.conformant,
+            "notes": self.notes,
+            "output": self.output,
+            "conformance_automated": self.conformance_automated,
+            "errors_diff": self.errors_diff,
+            "ignore_errors": self.ignore_errors,
+            "test_duration": self.test_duration,
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+        key_order = self.key_order + [
+            key for key in DEFAULT_KEY_ORDER if key not in self.key_order
+        ]
+
+        document = tomlkit.document()
+        for key in key_order:
+            value = values.get(key)
+            if value is None:
+                continue
+            if key in MULTILINE_KEYS:
+                assert isinstance(value, str)
+                document[key] = _multiline_string(value)
+            else:
+                document[key] = value
+        return document
+
+
+class ResultsStore:
+    """
+    The results of each type checker, stored in a SQLite database and
+    exported to the results files.
+    """
+
+    def __init__(self, root_dir: Path) -> None:
+        self._results_dir = root_dir / "results"
+        db_file = root_dir / ".cache" / "results.db"
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(db_file)
+
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._connection.executescript(
+                "DROP TABLE IF EXISTS results;"
+                "DROP TABLE IF EXISTS checkers;"
+                "DROP TABLE IF EXISTS sources;"
+            )
+            self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._connection.executescript(_SCHEMA)
+
+        # The type checkers whose version files, and the type checkers and
+        # tests whose results files, were imported when the store was opened.
+        self.imported_info: list[str] = []
+        self.imported_results: list[tuple[str, str]] = []
+        self._import_changed_files()
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+    def get_checkers(self) -> list[str]:
+        """
+        Returns the names of the type checkers that have results.
+        """
+        rows = self._connection.execute(
+            "SELECT DISTINCT checker FROM results ORDER BY checker"
+        )
+        return [checker for (checker,) in rows]
+
+    def get_info(self, checker: str) -> dict[str, Any]:
+        """
+        Returns the version and timings of the latest run of a type checker,
+        as recorded in its version file.
+        """
+        row = self._connection.execute(
+            "SELECT info FROM checkers WHERE checker = ?", (checker,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else {}
+
+    def get_all_info(self) -> dict[str, dict[str, Any]]:
+        """
+        Returns the version file contents of every type checker, keyed by
+        the name of the type checker.
+        """
+        rows = self._connection.execute("SELECT checker, info FROM checkers")
+        return {checker: json.loads(info) for checker, info in rows}
+
+    def put_info(self, checker: str, info: dict[str, Any]) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO checkers VALUES (?, ?, 0)",
+            (checker, json.dumps(info)),
+        )
+
+    def get_result(self, checker: str, test: str) -> TestResult | None:
+        """
+        Returns the latest results of a type checker for a test, or None if
+        there are none.
+        """
+        row = self._connection.execute(
+            f"{_LATEST_RESULTS} AND checker = ? AND test = ?", (checker, test)
+        ).fetchone()
+        return _make_result(row) if row is not None else None
+
+    def get_results(self, checker: str) -> dict[str, TestResult]:
+        """
+        Returns the latest results of a type checker for each test, keyed
+        by the name of the test.
+        """
+        rows = self._connection.execute(f"{_LATEST_RESULTS} AND checker = ?", (checker,))
+        return {row[1]: _make_result(row) for row in rows}
+
+    def get_all_results(self) -> dict[str, dict[str, TestResult]]:
+        """
+        Returns the latest results of every type checker for each test,
+        keyed by the name of the type checker and then of the test.
+        """
+        results: dict[str, dict[str, TestResult]] = {}
+        for row in self._connection.execute(_LATEST_RESULTS):
+            results.setdefault(row[0], {})[row[1]] = _make_result(row)
+        return results
+
+    def put_result(self, checker: str, result: TestResult, changed: bool = True) -> None:
+        """
+        Stores the results of a type checker for a test. If changed is true,
+        they are written to the results file when the store is exported.
+        """
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                checker,
+                result.version,
+                result.test,
+                result.conformant,
+                result.conformance_automated,
+                result.notes,
+                json.dumps(result.ignore_errors) if result.ignore_errors is not None else None,
+                result.output,
+                result.errors_diff,
+                result.test_duration,
+                result.peak_rss_mb,
+                json.dumps(result.key_order),
+                time_ns(),
+                0 if changed else 1,
+            ),
+        )
+
+    def export(self) -> None:
+        """
+        Writes the results and version files for everything that changed
+        since the store was last exported.
+        """
+        rows = self._connection.execute(
+            "SELECT checker, info FROM checkers WHERE exported = 0"
+        ).fetchall()
+        for checker, info in rows:
+            version_file = self._results_dir / checker / "version.toml"
+            version_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(version_file, "w") as f:
+                tomlkit.dump(json.loads(info), f)
+            self._record_source(version_file)
+        self._connection.execute("UPDATE checkers SET exported = 1")
+
+        rows = self._connection.execute(
+            "SELECT DISTINCT checker, test FROM results WHERE exported = 0"
+        ).fetchall()
+        for checker, test in rows:
+            result = self.get_result(checker, test)
+            assert result is not None
+            results_file = self._results_dir / checker / f"{test}.toml"
+            results_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(results_file, "w") as f:
+                tomlkit.dump(result.to_toml(), f)
+            self._record_source(results_file)
+        self._connection.execute("UPDATE results SET exported = 1 WHERE exported = 0")
+        self._connection.commit()
+
+    def _import_changed_files(self) -> None:
+        """
+        Imports any results files that were added, changed or removed since
+        they were last imported or exported.
+        """
+        known_files = {
+            path: (mtime_ns, size)
+            for path, mtime_ns, size in self._connection.execute("SELECT * FROM sources")
+        }
+
+        # Import the version file of a type checker before its results files,
+        # since the version is part of the key for each result.
+        files: list[Path] = []
+        if self._results_dir.is_dir():
+            for checker_dir in sorted(self._results_dir.iterdir()):
+                if checker_dir.is_dir():
+                    version_file = checker_dir / "version.toml"
+                    files.append(version_file)
+                    files.extend(
+                        path for path in sorted(checker_dir.glob("*.toml"))
+                        if path != version_file
+                    )
+
+        for path in files:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if known_files.pop(str(path), None) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    contents = tomli.load(f)
+            except tomli.TOMLDecodeError:
+                print(f"Error decoding {path}")
+                continue
+
+            checker = path.parent.name
+            if path.name == "version.toml":
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO checkers VALUES (?, ?, 1)",
+                    (checker, json.dumps(contents)),
+                )
+                self.imported_info.append(checker)
+            else:
+                version = self.get_info(checker).get("version", "")
+                self.put_result(
+                    checker, TestResult.from_toml(path.stem, version, contents), changed=False
+                )
+                self.imported_results.append((checker, path.stem))
+            self._record_source(path)
+
+        # Forget the results for any files that were removed.
+        for path_name in known_files:
+            path = Path(path_name)
+            if path.name == "version.toml":
+                self._connection.execute(
+                    "DELETE FROM checkers WHERE checker = ?", (path.parent.name,)
+                )
+            else:
+                self._connection.execute(
+                    "DELETE FROM results WHERE checker = ? AND test = ?",
+                    (path.parent.name, path.stem),
+                )
+            self._connection.execute("DELETE FROM sources WHERE path = ?", (path_name,))
+
+        self._connection.commit()
+
+    def _record_source(self, path: Path) -> None:
+        stat = path.stat()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+            (str(path), stat.st_mtime_ns, stat.st_size),
+        )
+
+
+def _multiline_string(value: str) -> tomlkit.items.String:
+    # Escape the value as in the existing results files, rather than as
+    # the installed version of tomlkit would, since some versions use
+    # escapes from TOML 1.1. The value starts on the line after the opening
+    # quotes; a newline there is dropped when the file is read.
+    escaped = []
+    for char in value:
+        if char == "\\":
+            escaped.append("\\\\")
+        elif char in "\n\t":
+            escaped.append(char)
+        elif ord(char) < 0x20 or ord(char) == 0x7F:
+            escaped.append(f"\\u{ord(char):04x}")
+        else:
+            escaped.append(char)
+    body = "".join(escaped).replace('"""', '""\\"')
+    return tomlkit.items.String(
+        tomlkit.items.StringType.MLB, value, f"\n{body}", tomlkit.items.Trivia()
+    )
+
+
+def _make_result(row: tuple) -> TestResult:
+    (
+        _,
+        test,
+        version,
+        conformant,
+        conformance_automated,
+        notes,
+        ignore_errors,
+        output,
+        errors_diff,
+        test_duration,
+        peak_rss_mb,
+        key_order,
+    ) = row
+    return TestResult(
+        test=test,
+        version=version,
+        conformant=conformant,
+        conformance_automated=conformance_automated,
+        notes=notes,
+        ignore_errors=json.loads(ignore_errors) if ignore_errors is not None else None,
+        output=output,
+        errors_diff=errors_diff,
+        test_duration=test_duration,
+        peak_rss_mb=peak_rss_mb,
+        key_order=json.loads(key_order),
+    )
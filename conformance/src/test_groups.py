@@ -9,6 +9,8 @@ from typing import Mapping, Sequence
 
 import tomli
 
+from dependencies import get_dependency_graph
+
 
 @dataclass
 class TestGroup:
@@ -44,3 +46,33 @@ def get_test_cases(
     ]
 
     return test_cases
+
+
+def select_test_cases(
+    test_cases: Sequence[Path],
+    test_names: Sequence[str] | None = None,
+    group_names: Sequence[str] | None = None,
+) -> Sequence[Path]:
+    # Filter test cases based on the test and test group names
+    # selected on the command line. If neither is given, all test
+    # cases are selected. Naming a helper module selects every test
+    # case that depends on it.
+    if not test_names and not group_names:
+        return test_cases
+
+    selected_tests = {Path(name).stem for name in test_names or []}
+    selected_groups = set(group_names or [])
+
+    if test_cases:
+        tests_dir = test_cases[0].parent
+        graph = get_dependency_graph(tests_dir)
+        for name in list(selected_tests):
+            for suffix in (".py", ".pyi"):
+                for dependent in graph.get_dependents(f"{name}{suffix}"):
+                    selected_tests.add(Path(dependent).stem)
+
+    return [
+        p
+        for p in test_cases
+        if p.stem in selected_tests or p.name.split("_")[0] in selected_groups
+    ]
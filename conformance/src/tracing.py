@@ -0,0 +1,95 @@
+"""
+Records where the test tool spends its time as a trace that can be
+viewed in Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import threading
+from time import time_ns
+from typing import Any, Iterator
+
+
+# The events recorded in this process, in Chrome's trace event format.
+_events: list[dict[str, Any]] = []
+
+# Whether spans are recorded. Tracing is off unless --trace is passed.
+_enabled = False
+
+
+def set_tracing(enabled: bool) -> None:
+    """Turn tracing on or off."""
+    global _enabled
+    _enabled = enabled
+
+
+def init_worker_tracing(enabled: bool) -> None:
+    """Initialize tracing in a worker process, which doesn't otherwise
+    share the setting. A forked worker inherits the events recorded in the
+    main process before it started, so these are discarded rather than
+    being sent back to the main process as the worker's own."""
+    set_tracing(enabled)
+    _events.clear()
+
+
+def is_tracing() -> bool:
+    return _enabled
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """Record the time taken by the block as a span with the given name.
+    Any keyword arguments are shown alongside the span."""
+    if not _enabled:
+        yield
+        return
+
+    start_ns = time_ns()
+    try:
+        yield
+    finally:
+        _events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start_ns / 1000,
+                "dur": (time_ns() - start_ns) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+
+def take_trace_events() -> list[dict[str, Any]]:
+    """Remove and return the events recorded so far in this process, so
+    that a worker process can send them back to the main process."""
+    events = list(_events)
+    _events.clear()
+    return events
+
+
+def add_trace_events(events: list[dict[str, Any]]) -> None:
+    """Add events that were recorded in a worker process."""
+    _events.extend(events)
+
+
+def write_trace(trace_file: Path) -> None:
+    """Write the recorded events to a file, naming the track for each
+    process so that each worker appears on its own track."""
+    main_pid = os.getpid()
+    pids = sorted({event["pid"] for event in _events})
+    metadata = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": pid,
+            "args": {"name": "main" if pid == main_pid else f"worker {pid}"},
+        }
+        for pid in pids
+    ]
+
+    with open(trace_file, "w") as f:
+        json.dump({"traceEvents": metadata + _events}, f)
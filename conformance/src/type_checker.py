@@ -3,24 +3,70 @@ Classes that abstract differences between type checkers.
 """
 
 from abc import ABC, abstractmethod
-from curses.ascii import isspace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
 import json
 from pathlib import Path
 import os
 import re
-from pytype import config as pytype_config
-from pytype import io as pytype_io
-from pytype import analyze as pytype_analyze
-from pytype.errors import errors as pytype_errors
-from pytype import load_pytd as pytype_loader
+from queue import Queue
 import shutil
-from subprocess import PIPE, CalledProcessError, run
+import site
+from subprocess import PIPE, CalledProcessError, Popen, run
 import sys
+from threading import Thread
+from time import time
 from tqdm import tqdm
-from typing import Sequence
+from typing import TYPE_CHECKING, Any, Iterable, Sequence
+
+from dependencies import get_files_to_check
+from diagnostics import Diagnostic
+from environments import Environment, provision_environment
+from resource_usage import (
+    ResourceUsage,
+    measure_in_process,
+    record_resource_usage,
+    run_with_usage,
+    track_resource_usage,
+)
+
+if TYPE_CHECKING:
+    from pytype.errors import errors as pytype_errors
+
+
+class OutputByFile:
+    """
+    Collects the lines of a type checker's output into a list for each
+    file as they are read, for output in which each line starts with
+    the name of the file it refers to.
+    """
+
+    def __init__(self) -> None:
+        self._lines: dict[str, list[str]] = {}
+
+    def add_line(self, line: str) -> None:
+        line = line.removesuffix("\n")
+        file_name = line.split(":")[0].strip()
+        self._lines.setdefault(file_name, []).append(line)
+
+    def get_output(self) -> dict[str, str]:
+        """
+        Returns the output for each file, keyed by the file name.
+        """
+        return {
+            file_name: "".join(f"{line}\n" for line in lines)
+            for file_name, lines in self._lines.items()
+        }
 
 
 class TypeChecker(ABC):
+    # Whether the type checker runs in this process rather than as a command.
+    runs_in_process = False
+
+    # The environment the type checker is installed in, or None if it is
+    # run from the same environment as the test tool.
+    environment: Environment | None = None
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -44,6 +90,29 @@ class TypeChecker(ABC):
         """
         raise NotImplementedError
 
+    def get_python(self) -> str:
+        """
+        Returns the Python interpreter to run the type checker with.
+        """
+        if self.environment is None:
+            return sys.executable
+        return self.environment.get_python()
+
+    def get_script(self, name: str) -> str:
+        """
+        Returns the path of a script installed with the type checker.
+        """
+        if self.environment is None:
+            return name
+        return self.environment.get_script(name)
+
+    def get_options(self) -> Sequence[str]:
+        """
+        Returns the options that affect the type checker's output.
+        These are part of the key used to cache results.
+        """
+        return ()
+
     @abstractmethod
     def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
         """
@@ -52,39 +121,78 @@ class TypeChecker(ABC):
         """
         raise NotImplementedError
 
+    def get_timing_info(self) -> dict[str, float]:
+        """
+        Returns timings from the most recent call to run_tests in addition
+        to the overall test duration, keyed by name.
+        """
+        return {}
+
+    def get_test_durations(self) -> dict[str, float]:
+        """
+        Returns the time taken to check each test file in the most recent
+        call to run_tests, keyed by file name. Only type checkers that check
+        one file at a time can report this.
+        """
+        return {}
+
+    def get_diagnostics(self) -> dict[str, list[Diagnostic]]:
+        """
+        Returns the diagnostics for each test file from the most recent
+        call to run_tests, keyed by file name. Only type checkers that
+        report structured diagnostics return these; the output of other
+        type checkers is parsed with parse_diagnostics instead.
+        """
+        return {}
+
+    def close(self) -> None:
+        """
+        Shuts down any processes that the type checker keeps running
+        between calls to run_tests.
+        """
+        pass
+
+    def clear_cache(self) -> None:
+        """
+        Deletes any cache that the type checker keeps on disk between
+        calls to run_tests, so that the next run is measured from a cold
+        start rather than as an incremental check.
+        """
+        pass
+
     @abstractmethod
-    def parse_errors(self, output: Sequence[str]) -> dict[int, list[str]]:
+    def parse_diagnostics(self, output: str) -> list[Diagnostic]:
         """
-        Parses type checker output to summarize the lines on which errors occurred.
+        Parses the type checker output for a test file into diagnostics.
         """
         raise NotImplementedError
 
+    def is_error(self, diagnostic: Diagnostic) -> bool:
+        """
+        Returns whether a diagnostic counts as an error when comparing
+        against the errors expected by a test.
+        """
+        return diagnostic.severity == "error"
+
 
 class MypyTypeChecker(TypeChecker):
+    # Mypy shows the error code for notes only for these codes.
+    _SHOW_NOTE_CODES = ("annotation-unchecked", "deprecated")
+
+    def __init__(self) -> None:
+        self._diagnostics: dict[str, list[Diagnostic]] = {}
+
     @property
     def name(self) -> str:
         return "mypy"
 
     def install(self) -> bool:
-        try:
-            # Delete the cache for consistent timings.
-            shutil.rmtree(".mypy_cache")
-        except (shutil.Error, OSError):
-            # Ignore any errors here.
-            pass
+        # Delete the cache for consistent timings.
+        self.clear_cache()
 
         try:
-            # Uninstall any existing version if present.
-            run(
-                [sys.executable, "-m", "pip", "uninstall", "mypy", "-y"],
-                check=True,
-            )
-
-            # Install the latest version.
-            run(
-                [sys.executable, "-m", "pip", "install", "mypy"],
-                check=True,
-            )
+            # Install the latest version into its own environment.
+            self.environment = provision_environment("mypy")
 
             # Run "mypy --version" to ensure that it's installed and to work
             # around timing issues caused by malware scanners on some systems.
@@ -96,67 +204,217 @@ class MypyTypeChecker(TypeChecker):
             return False
 
     def get_version(self) -> str:
-        proc = run([sys.executable, "-m", "mypy", "--version"], stdout=PIPE, text=True)
+        proc = run(
+            [self.get_python(), "-m", "mypy", "--version"], stdout=PIPE, text=True
+        )
         version = proc.stdout.strip()
 
         # Remove the " (compiled)" if it's present.
         version = version.split(" (")[0]
         return version
 
-    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
-        command = [
-            sys.executable,
-            "-m",
-            "mypy",
-            ".",
+    def clear_cache(self) -> None:
+        try:
+            shutil.rmtree(".mypy_cache")
+        except (shutil.Error, OSError):
+            # Ignore any errors here.
+            pass
+
+    def get_options(self) -> Sequence[str]:
+        return [
             "--disable-error-code",
             "empty-body",
             "--enable-error-code",
             "deprecated",
         ]
-        proc = run(command, stdout=PIPE, text=True)
-        lines = proc.stdout.split("\n")
 
-        # Add results to a dictionary keyed by the file name.
-        results_dict: dict[str, str] = {}
-        for line in lines:
-            file_name = line.split(":")[0].strip()
-            results_dict[file_name] = results_dict.get(file_name, "") + line + "\n"
+    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
+        command = [
+            self.get_python(),
+            "-m",
+            "mypy",
+            *get_files_to_check(test_files),
+            *self.get_options(),
+            "--output",
+            "json",
+        ]
+        self._diagnostics = {}
+        run_with_usage(command, stdout=PIPE, text=True, on_line=self.add_json_line)
+        return self.get_output()
 
-        return results_dict
+    def add_json_line(self, line: str) -> None:
+        """
+        Adds a diagnostic from a line of mypy's JSON output, which has one
+        object per line. This is called as each line is read.
+        """
+        # Skip anything that isn't a diagnostic, such as a crash report.
+        if not line.startswith("{"):
+            return
+        diagnostic = json.loads(line)
+        file_name = diagnostic["file"]
+        column = diagnostic["column"]
+        diagnostics = self._diagnostics.setdefault(file_name, [])
+        diagnostics.append(
+            self._make_diagnostic(
+                file_name,
+                diagnostic["line"],
+                column + 1 if column >= 0 else None,
+                diagnostic["severity"],
+                diagnostic["code"],
+                diagnostic["message"],
+            )
+        )
 
-    def parse_errors(self, output: Sequence[str]) -> dict[int, list[str]]:
+        # Hints are shown as notes following the diagnostic.
+        for hint in (diagnostic["hint"] or "").splitlines():
+            diagnostics.append(
+                self._make_diagnostic(file_name, diagnostic["line"], None, "note", None, hint)
+            )
+
+    def get_output(self) -> dict[str, str]:
+        """
+        Returns the text output equivalent to the diagnostics, keyed by
+        the file name.
+        """
+        return {
+            file_name: "".join(f"{d.text}\n" for d in diagnostics)
+            for file_name, diagnostics in self._diagnostics.items()
+        }
+
+    def _make_diagnostic(
+        self,
+        file_name: str,
+        line: int,
+        column: int | None,
+        severity: str,
+        code: str | None,
+        message: str,
+    ) -> Diagnostic:
+        # Use the same format as the text output.
+        text = f"{file_name}:{line}: {severity}: {message}"
+        if code is not None and (severity != "note" or code in self._SHOW_NOTE_CODES):
+            text += f"  [{code}]"
+        return Diagnostic(
+            file=file_name,
+            line=line,
+            column=column,
+            severity=severity,
+            code=code,
+            message=message,
+            text=text,
+        )
+
+    def get_diagnostics(self) -> dict[str, list[Diagnostic]]:
+        return self._diagnostics
+
+    def parse_diagnostics(self, output: str) -> list[Diagnostic]:
         # narrowing_typeguard.py:102: error: TypeGuard functions must have a positional argument  [valid-type]
-        line_to_errors: dict[int, list[str]] = {}
-        for line in output:
+        diagnostics: list[Diagnostic] = []
+        for line in output.splitlines():
             if line.count(":") < 3:
                 continue
-            _, lineno, kind, _ = line.split(":", maxsplit=3)
-            kind = kind.strip()
-            if kind != "error":
-                continue
-            line_to_errors.setdefault(int(lineno), []).append(line)
-        return line_to_errors
+            file_name, lineno, kind, message = line.split(":", maxsplit=3)
+            match = re.fullmatch(r"(.*)  \[([a-z0-9-]+)\]", message)
+            if match is not None:
+                message, code = match.groups()
+            else:
+                code = None
+            diagnostics.append(
+                Diagnostic(
+                    file=file_name,
+                    line=int(lineno),
+                    column=None,
+                    severity=kind.strip(),
+                    code=code,
+                    message=message.removeprefix(" "),
+                    text=line,
+                )
+            )
+        return diagnostics
+
+
+class DmypyTypeChecker(MypyTypeChecker):
+    """
+    Runs mypy through its daemon, which is left running between runs so
+    that later runs are incremental.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._timing_info: dict[str, float] = {}
+
+    def install(self) -> bool:
+        if not super().install():
+            return False
+
+        # A daemon that was started by a different version of mypy
+        # must be restarted so that it picks up the new version.
+        try:
+            with open(".dmypy_version", "r") as f:
+                daemon_version = f.read().strip()
+        except FileNotFoundError:
+            daemon_version = None
+
+        if daemon_version != self.get_version():
+            self.stop_daemon()
+
+        return True
+
+    def stop_daemon(self) -> None:
+        run([self.get_python(), "-m", "mypy.dmypy", "kill"], stdout=PIPE, stderr=PIPE)
+        try:
+            os.remove(".dmypy_version")
+        except FileNotFoundError:
+            pass
+
+    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
+        # The status command fails if the daemon isn't running, in
+        # which case this run includes the cost of starting it.
+        status = run_with_usage(
+            [self.get_python(), "-m", "mypy.dmypy", "status"], stdout=PIPE, stderr=PIPE
+        )
+        is_warm = status.returncode == 0
+        if not is_warm:
+            with open(".dmypy_version", "w") as f:
+                f.write(self.get_version())
+
+        command = [
+            self.get_python(),
+            "-m",
+            "mypy.dmypy",
+            "run",
+            "--",
+            *get_files_to_check(test_files),
+            *self.get_options(),
+            "--output",
+            "json",
+        ]
+        self._diagnostics = {}
+        test_start_time = time()
+        run_with_usage(command, stdout=PIPE, text=True, on_line=self.add_json_line)
+        test_duration = time() - test_start_time
+
+        timing_key = "test_duration_warm" if is_warm else "test_duration_cold"
+        self._timing_info = {timing_key: test_duration}
+
+        return self.get_output()
+
+    def get_timing_info(self) -> dict[str, float]:
+        return self._timing_info
 
 
 class PyrightTypeChecker(TypeChecker):
+    def __init__(self) -> None:
+        self._diagnostics: dict[str, list[Diagnostic]] = {}
+
     @property
     def name(self) -> str:
         return "pyright"
 
     def install(self) -> bool:
         try:
-            # Uninstall any old version if present.
-            run(
-                [sys.executable, "-m", "pip", "uninstall", "pyright", "-y"],
-                check=True,
-            )
-
-            # Install the latest version.
-            run(
-                [sys.executable, "-m", "pip", "install", "pyright"],
-                check=True,
-            )
+            # Install the latest version into its own environment.
+            self.environment = provision_environment("pyright")
 
             # Force the Python wrapper to install node if needed
             # and download the latest version of pyright.
@@ -168,46 +426,329 @@ class PyrightTypeChecker(TypeChecker):
 
     def get_version(self) -> str:
         proc = run(
-            [sys.executable, "-m", "pyright", "--version"], stdout=PIPE, text=True
+            [self.get_python(), "-m", "pyright", "--version"], stdout=PIPE, text=True
         )
         return proc.stdout.strip()
 
     def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
-        command = [sys.executable, "-m", "pyright", ".", "--outputjson"]
-        proc = run(command, stdout=PIPE, text=True)
+        command = [
+            self.get_python(),
+            "-m",
+            "pyright",
+            *get_files_to_check(test_files),
+            "--outputjson",
+        ]
+        proc = run_with_usage(command, stdout=PIPE, text=True)
         output_json = json.loads(proc.stdout)
-        diagnostics = output_json["generalDiagnostics"]
 
-        # Add results to a dictionary keyed by the file name.
-        results_dict: dict[str, str] = {}
-        for diagnostic in diagnostics:
-            file_path = Path(diagnostic.get("file", ""))
-            file_name = file_path.name
-            line_number = diagnostic["range"]["start"]["line"] + 1
-            col_number = diagnostic["range"]["start"]["character"] + 1
-            severity = diagnostic["severity"]
-            message = diagnostic["message"]
-            rule = f" ({diagnostic['rule']})" if "rule" in diagnostic else ""
+        self._diagnostics = {}
+        for diagnostic in output_json["generalDiagnostics"]:
+            self._add_diagnostic(
+                Path(diagnostic.get("file", "")).name,
+                diagnostic,
+                diagnostic["severity"],
+                diagnostic.get("rule"),
+            )
+
+        return self._format_diagnostics()
+
+    def get_diagnostics(self) -> dict[str, list[Diagnostic]]:
+        return self._diagnostics
+
+    def _add_diagnostic(
+        self, file_name: str, raw: dict[str, Any], severity: str, rule: str | None
+    ) -> None:
+        diagnostic = Diagnostic(
+            file=file_name,
+            line=raw["range"]["start"]["line"] + 1,
+            column=raw["range"]["start"]["character"] + 1,
+            severity=severity,
+            code=rule,
+            message=raw["message"],
+            text="",
+        )
+        text = self._format_diagnostic(diagnostic).split("\n")[0]
+        self._diagnostics.setdefault(file_name, []).append(replace(diagnostic, text=text))
 
-            line_text = f"{file_name}:{line_number}:{col_number} - {severity}: {message}{rule}\n"
-            results_dict[file_name] = results_dict.get(file_name, "") + line_text
+    def _format_diagnostics(self) -> dict[str, str]:
+        # Add results to a dictionary keyed by the file name.
+        return {
+            file_name: "".join(f"{self._format_diagnostic(d)}\n" for d in diagnostics)
+            for file_name, diagnostics in self._diagnostics.items()
+        }
 
-        return results_dict
+    @staticmethod
+    def _format_diagnostic(diagnostic: Diagnostic) -> str:
+        # Use the same format as the command-line output.
+        rule = f" ({diagnostic.code})" if diagnostic.code is not None else ""
+        return (
+            f"{diagnostic.file}:{diagnostic.line}:{diagnostic.column} - "
+            f"{diagnostic.severity}: {diagnostic.message}{rule}"
+        )
 
-    def parse_errors(self, output: Sequence[str]) -> dict[int, list[str]]:
+    def parse_diagnostics(self, output: str) -> list[Diagnostic]:
         # narrowing_typeguard.py:102:9 - error: User-defined type guard functions and methods must have at least one input parameter (reportGeneralTypeIssues)
-        line_to_errors: dict[int, list[str]] = {}
-        for line in output:
-            # Ignore indented notes
+        diagnostics: list[Diagnostic] = []
+        message_lines: list[str] = []
+
+        def add_diagnostic() -> None:
+            # The rule follows the last line of a multi-line message.
+            message = "\n".join(message_lines)
+            match = re.fullmatch(r"(.*) \((\w+)\)", message, re.DOTALL)
+            if match is not None:
+                message, code = match.groups()
+            else:
+                code = None
+            diagnostics[-1] = replace(diagnostics[-1], message=message, code=code)
+
+        for line in output.splitlines():
+            # Indented lines continue the message of the previous diagnostic.
             if not line or line[0].isspace():
+                if line and diagnostics:
+                    message_lines.append(line)
                 continue
+            if diagnostics:
+                add_diagnostic()
             assert line.count(":") >= 3, f"Failed to parse line: {line!r}"
-            _, lineno, kind, _ = line.split(":", maxsplit=3)
-            kind = kind.split()[-1]
-            if kind not in ("error", "warning"):
+            file_name, lineno, position, message = line.split(":", maxsplit=3)
+            col_number, _, kind = position.split()
+            diagnostics.append(
+                Diagnostic(
+                    file=file_name,
+                    line=int(lineno),
+                    column=int(col_number),
+                    severity=kind,
+                    code=None,
+                    message="",
+                    text=line,
+                )
+            )
+            message_lines = [message.strip()]
+        if diagnostics:
+            add_diagnostic()
+        return diagnostics
+
+    def is_error(self, diagnostic: Diagnostic) -> bool:
+        return diagnostic.severity in ("error", "warning")
+
+
+class PyrightLanguageServerTypeChecker(PyrightTypeChecker):
+    """
+    Runs pyright as a language server over stdio. The server is started on
+    the first run and kept running until close is called, so later runs
+    avoid the cost of starting node and analyzing the stdlib stubs again.
+    """
+
+    # Maps LSP diagnostic severities to the names used by the pyright CLI.
+    # Hints (severity 4) are not reported by the CLI, so they are skipped.
+    _SEVERITIES = {1: "error", 2: "warning", 3: "information"}
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._server: Popen | None = None
+
+        # The messages read from the server, followed by None if it exits.
+        self._messages: Queue[dict[str, Any] | None] = Queue()
+        self._next_id = 0
+
+        # The version and text of each document opened in the server.
+        self._documents: dict[str, tuple[int, str]] = {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        # The server can't be shared with another process, so a
+        # copy of this type checker starts its own from the same
+        # environment.
+        assert self._server is None, "Cannot copy a running language server"
+        return {"environment": self.environment}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        PyrightLanguageServerTypeChecker.__init__(self)
+        self.environment = state["environment"]
+
+    def get_options(self) -> Sequence[str]:
+        # The language server reports diagnostics through a different path
+        # from the command-line version, so their results are cached
+        # separately in case their output ever differs.
+        return ["--langserver"]
+
+    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
+        if self._server is None:
+            self._start_server()
+
+        # Open any new files and send the contents of any that have changed
+        # on disk since the last run, including the helper modules.
+        for file in get_files_to_check(test_files):
+            with open(file, "r") as f:
+                text = f.read()
+            uri = Path(file).resolve().as_uri()
+            if file not in self._documents:
+                self._documents[file] = (1, text)
+                self._notify(
+                    "textDocument/didOpen",
+                    {
+                        "textDocument": {
+                            "uri": uri,
+                            "languageId": "python",
+                            "version": 1,
+                            "text": text,
+                        }
+                    },
+                )
+            elif self._documents[file][1] != text:
+                version = self._documents[file][0] + 1
+                self._documents[file] = (version, text)
+                self._notify(
+                    "textDocument/didChange",
+                    {
+                        "textDocument": {"uri": uri, "version": version},
+                        "contentChanges": [{"text": text}],
+                    },
+                )
+
+        # Pyright publishes empty diagnostics for open files that it has
+        # not checked yet, so there is no reliable point at which pushed
+        # diagnostics are complete. Instead, pull the diagnostics for each
+        # file, which pyright answers only once the file has been checked.
+        request_ids = {
+            self._request(
+                "textDocument/diagnostic",
+                {"textDocument": {"uri": Path(file).resolve().as_uri()}},
+            ): file
+            for file in test_files
+        }
+        responses = self._wait_for_responses(request_ids.keys())
+
+        # The command-line version sorts diagnostics by their position, so
+        # do the same here.
+        self._diagnostics = {}
+        for request_id, file_name in request_ids.items():
+            diagnostics = sorted(
+                responses[request_id].get("items", []),
+                key=lambda d: (d["range"]["start"]["line"], d["range"]["start"]["character"]),
+            )
+            for diagnostic in diagnostics:
+                severity = self._SEVERITIES.get(diagnostic.get("severity", 1))
+                if severity is None:
+                    continue
+                self._add_diagnostic(file_name, diagnostic, severity, diagnostic.get("code"))
+
+        return self._format_diagnostics()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        # Only shut the server down if it is still running.
+        if self._server.poll() is None:
+            shutdown_id = self._request("shutdown", None)
+            self._wait_for_responses([shutdown_id])
+            self._notify("exit", None)
+            self._server.wait()
+        self._server = None
+        self._documents = {}
+
+    def _start_server(self) -> None:
+        self._server = Popen(
+            [self.get_python(), "-m", "pyright.langserver", "--stdio"],
+            stdin=PIPE,
+            stdout=PIPE,
+        )
+
+        # Read messages on a separate thread so that the server never
+        # blocks writing to stdout while we are writing to its stdin.
+        Thread(target=self._read_messages, args=(self._server,), daemon=True).start()
+
+        # Pyright ignores rootUri and only treats the workspace folders as
+        # execution roots. Without one, it resolves imports differently from
+        # the command-line version, which misses diagnostics such as
+        # reportMissingModuleSource for the helper stubs.
+        root_uri = Path(".").resolve().as_uri()
+        initialize_id = self._request(
+            "initialize",
+            {
+                "processId": os.getpid(),
+                "rootUri": root_uri,
+                "workspaceFolders": [{"uri": root_uri, "name": "tests"}],
+                "capabilities": {
+                    "textDocument": {"diagnostic": {}},
+                    "workspace": {"configuration": True},
+                },
+            },
+        )
+        self._wait_for_responses([initialize_id])
+        self._notify("initialized", {})
+
+    def _read_messages(self, server: Popen) -> None:
+        assert server.stdout is not None
+        while True:
+            content_length = None
+            while True:
+                header = server.stdout.readline()
+                if not header:
+                    self._messages.put(None)
+                    return
+                if header == b"\r\n":
+                    break
+                name, value = header.decode("ascii").split(":", 1)
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            assert content_length is not None
+            self._messages.put(json.loads(server.stdout.read(content_length)))
+
+    def _send(self, message: dict[str, Any]) -> None:
+        assert self._server is not None and self._server.stdin is not None
+        body = json.dumps({"jsonrpc": "2.0", **message}).encode("utf-8")
+        self._server.stdin.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii"))
+        self._server.stdin.write(body)
+        self._server.stdin.flush()
+
+    def _notify(self, method: str, params: Any) -> None:
+        self._send({"method": method, "params": params})
+
+    def _request(self, method: str, params: Any) -> int:
+        self._next_id += 1
+        self._send({"id": self._next_id, "method": method, "params": params})
+        return self._next_id
+
+    def _wait_for_responses(self, request_ids: Iterable[int]) -> dict[int, Any]:
+        pending = set(request_ids)
+        responses: dict[int, Any] = {}
+        while pending:
+            message = self._messages.get()
+            if message is None:
+                # The server exited, so a new one is started on the next run.
+                assert self._server is not None
+                returncode = self._server.wait()
+                self._server = None
+                self._documents = {}
+                raise RuntimeError(
+                    f"Pyright language server exited unexpectedly with code {returncode}"
+                )
+            if message.get("method") == "workspace/configuration":
+                # Point the server at the same interpreter that the
+                # command-line version finds, and use the defaults for
+                # everything else.
+                result = [
+                    {"pythonPath": sys.executable}
+                    if item.get("section") == "python"
+                    else None
+                    for item in message["params"]["items"]
+                ]
+                self._send({"id": message["id"], "result": result})
+                continue
+            if "method" in message:
+                # Reply to any other requests from the server with null.
+                if "id" in message:
+                    self._send({"id": message["id"], "result": None})
                 continue
-            line_to_errors.setdefault(int(lineno), []).append(line)
-        return line_to_errors
+            if "error" in message:
+                raise RuntimeError(f"Pyright language server error: {message['error']}")
+            if message.get("id") in pending:
+                pending.remove(message["id"])
+                responses[message["id"]] = message["result"]
+        return responses
+
+
+PYRE_CONFIG = '{"site_package_search_strategy": "pep561", "source_directories": ["."]}\n'
 
 
 class PyreTypeChecker(TypeChecker):
@@ -224,22 +765,12 @@ class PyreTypeChecker(TypeChecker):
             pass
 
         try:
-            # Uninstall any existing version if present.
-            run(
-                [sys.executable, "-m", "pip", "uninstall", "pyre-check", "-y"],
-                check=True,
-            )
-
-            # Install the latest version.
-            run(
-                [sys.executable, "-m", "pip", "install", "pyre-check"],
-                check=True,
-            )
+            # Install the latest version into its own environment.
+            self.environment = provision_environment("pyre-check")
 
             # Generate a default config file.
-            pyre_config = '{"site_package_search_strategy": "pep561", "source_directories": ["."]}\n'
             with open(".pyre_configuration", "w") as f:
-                f.write(pyre_config)
+                f.write(PYRE_CONFIG)
 
             return True
         except CalledProcessError:
@@ -247,57 +778,147 @@ class PyreTypeChecker(TypeChecker):
             return False
 
     def get_version(self) -> str:
-        proc = run(["pyre", "--version"], stdout=PIPE, text=True)
+        proc = run([self.get_script("pyre"), "--version"], stdout=PIPE, text=True)
         version = proc.stdout.strip()
         version = version.replace("Client version:", "pyre")
         return version
 
-    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
-        proc = run(["pyre", "check"], stdout=PIPE, text=True)
-        lines = proc.stdout.split("\n")
+    def get_options(self) -> Sequence[str]:
+        return [PYRE_CONFIG]
 
-        # Add results to a dictionary keyed by the file name.
-        results_dict: dict[str, str] = {}
-        for line in lines:
-            file_name = line.split(":")[0].strip()
-            results_dict[file_name] = results_dict.get(file_name, "") + line + "\n"
+    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
+        # Pyre always analyzes the source directory from its configuration,
+        # but only type checks and reports errors for these paths.
+        command = [self.get_script("pyre")]
+        for file in get_files_to_check(test_files):
+            command += ["--only-check-paths", file]
+        command.append("check")
 
-        return results_dict
+        output = OutputByFile()
+        run_with_usage(command, stdout=PIPE, text=True, on_line=output.add_line)
+        return output.get_output()
 
-    def parse_errors(self, output: Sequence[str]) -> dict[int, list[str]]:
+    def parse_diagnostics(self, output: str) -> list[Diagnostic]:
         # narrowing_typeguard.py:17:33 Incompatible parameter type [6]: In call `typing.GenericMeta.__getitem__`, for 1st positional argument, expected `Type[Variable[_T_co](covariant)]` but got `Tuple[Type[str], Type[str]]`.
-        line_to_errors: dict[int, list[str]] = {}
-        for line in output:
+        diagnostics: list[Diagnostic] = []
+        for line in output.splitlines():
             # Ignore multi-line errors
             if ".py:" not in line:
                 continue
-            # Ignore reveal_type errors
-            if "Revealed type [-1]" in line:
-                continue
             assert line.count(":") >= 2, f"Failed to parse line: {line!r}"
-            _, lineno, _ = line.split(":", maxsplit=2)
-            line_to_errors.setdefault(int(lineno), []).append(line)
-        return line_to_errors
+            file_name, lineno, rest = line.split(":", maxsplit=2)
+            match = re.fullmatch(r"(\d+) (.*?) \[(-?\d+)\]: (.*)", rest)
+            if match is not None:
+                col_number, kind, code, message = match.groups()
+                message = f"{kind}: {message}"
+            else:
+                col_number, code, message = None, None, rest
+            diagnostics.append(
+                Diagnostic(
+                    file=file_name,
+                    line=int(lineno),
+                    column=int(col_number) if col_number is not None else None,
+                    severity="error",
+                    code=code,
+                    message=message,
+                    text=line,
+                )
+            )
+        return diagnostics
+
+    def is_error(self, diagnostic: Diagnostic) -> bool:
+        # Ignore reveal_type errors
+        return "Revealed type [-1]" not in diagnostic.text
+
+
+class PyreServerTypeChecker(PyreTypeChecker):
+    """
+    Starts a pyre server on the first run and uses incremental checks for
+    later runs. The server is stopped when close is called.
+    """
+
+    def __init__(self) -> None:
+        self._server_running = False
+        self._timing_info: dict[str, float] = {}
+
+        # Without watchman, the server doesn't see changes to the files,
+        # so it is restarted whenever one of them changes.
+        self._use_watchman = shutil.which("watchman") is not None
+        self._file_contents: dict[str, bytes] = {}
+
+    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
+        self._timing_info = {}
+
+        # The server is shared by all runs, so it checks the whole source
+        # directory rather than just the requested files.
+        if self._server_running and not self._use_watchman:
+            file_contents = self._read_files()
+            if file_contents != self._file_contents:
+                self.close()
+
+        if not self._server_running:
+            command = [self.get_script("pyre"), "restart"]
+            if not self._use_watchman:
+                command.append("--no-watchman")
+                self._file_contents = self._read_files()
+
+            start_time = time()
+            run_with_usage(command, stdout=PIPE, check=True)
+            self._timing_info["server_start_duration"] = time() - start_time
+            self._server_running = True
+
+        start_time = time()
+        output = OutputByFile()
+        run_with_usage(
+            [self.get_script("pyre"), "incremental"],
+            stdout=PIPE,
+            text=True,
+            on_line=output.add_line,
+        )
+        self._timing_info["recheck_duration"] = time() - start_time
+
+        return output.get_output()
+
+    def get_timing_info(self) -> dict[str, float]:
+        return self._timing_info
+
+    def close(self) -> None:
+        if self._server_running:
+            run([self.get_script("pyre"), "stop"], stdout=PIPE)
+            self._server_running = False
+
+    def _read_files(self) -> dict[str, bytes]:
+        contents: dict[str, bytes] = {}
+        for file in sorted(os.listdir(".")):
+            if file.endswith((".py", ".pyi")):
+                with open(file, "rb") as f:
+                    contents[file] = f.read()
+        return contents
+
+
+# Specify 3.11 for now to work around the fact that pytype
+# currently doesn't support 3.12 and emits an error when
+# running on 3.12.
+PYTYPE_OPTIONS = {"python_version": (3, 11), "quick": True}
 
 
 class PytypeTypeChecker(TypeChecker):
+    runs_in_process = True
+
+    def __init__(self, shards: int = 1) -> None:
+        # The number of processes to split the test files across.
+        self.shards = shards
+        self._test_durations: dict[str, float] = {}
+        self._diagnostics: dict[str, list[Diagnostic]] = {}
+
     @property
     def name(self) -> str:
         return "pytype"
 
     def install(self) -> bool:
         try:
-            # Uninstall any existing version if present.
-            run(
-                [sys.executable, "-m", "pip", "uninstall", "pytype", "-y"],
-                check=True,
-            )
-
-            # Install the latest version.
-            run(
-                [sys.executable, "-m", "pip", "install", "pytype"],
-                check=True,
-            )
+            # Install the latest version into its own environment.
+            self.environment = provision_environment("pytype")
 
             return True
         except CalledProcessError:
@@ -306,24 +927,92 @@ class PytypeTypeChecker(TypeChecker):
 
     def get_version(self) -> str:
         proc = run(
-            [sys.executable, "-m", "pytype", "--version"], stdout=PIPE, text=True
+            [self.get_python(), "-m", "pytype", "--version"], stdout=PIPE, text=True
         )
         version = proc.stdout.strip()
         return f"pytype {version}"
 
+    def get_options(self) -> Sequence[str]:
+        return [f"{key}={value}" for key, value in PYTYPE_OPTIONS.items()]
+
     def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
-        # Specify 3.11 for now to work around the fact that pytype
-        # currently doesn't support 3.12 and emits an error when
-        # running on 3.12.
-        options = pytype_config.Options.create(python_version=(3, 11), quick=True)
+        # Pytype checks one file at a time, so the helper modules do not
+        # need to be checked separately.
+        files = list(test_files)
+
+        if self.shards <= 1:
+            results_dict, self._diagnostics, self._test_durations, _ = self.check_files(
+                files, show_progress=True
+            )
+            return results_dict
+
+        # Split the files round-robin across the shards. Each shard is
+        # checked in its own process with its own loader.
+        shards = [files[i :: self.shards] for i in range(self.shards)]
+        shards = [shard for shard in shards if shard]
+
+        shard_results: dict[str, str] = {}
+        self._diagnostics = {}
+        self._test_durations = {}
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(self.check_files, shard) for shard in shards]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                results_dict, diagnostics, test_durations, usage = future.result()
+                shard_results.update(results_dict)
+                self._diagnostics.update(diagnostics)
+                self._test_durations.update(test_durations)
+                record_resource_usage(usage, concurrent=True)
+
+        # Merge the results in the same order as a serial run.
+        return {fi: shard_results[fi] for fi in files}
+
+    def get_test_durations(self) -> dict[str, float]:
+        return self._test_durations
+
+    def get_diagnostics(self) -> dict[str, list[Diagnostic]]:
+        return self._diagnostics
+
+    def check_files(self, files: Sequence[str], show_progress: bool = False) -> tuple[
+        dict[str, str], dict[str, list[Diagnostic]], dict[str, float], ResourceUsage
+    ]:
+        """
+        Checks each of the files in turn, sharing a single loader
+        between them. Returns the output, diagnostics and time taken for
+        each file, along with the resources used. This is run in a worker
+        process when sharding.
+        """
+        with track_resource_usage() as usage, measure_in_process():
+            results_dict, diagnostics, test_durations = self._check_files(
+                files, show_progress
+            )
+        return results_dict, diagnostics, test_durations, usage
+
+    def _check_files(self, files: Sequence[str], show_progress: bool) -> tuple[
+        dict[str, str], dict[str, list[Diagnostic]], dict[str, float]
+    ]:
+        # Pytype runs in this process, so make its environment importable.
+        # The environment goes first on the path so that its version of
+        # pytype is imported rather than any installed with the test tool.
+        # It is slow to import, so it is only imported when it is run.
+        if self.environment is not None:
+            old_path = list(sys.path)
+            site.addsitedir(self.environment.get_site_packages())
+            sys.path[:] = [p for p in sys.path if p not in old_path] + old_path
+        from pytype import analyze as pytype_analyze
+        from pytype import config as pytype_config
+        from pytype import io as pytype_io
+        from pytype import load_pytd as pytype_loader
+
+        options = pytype_config.Options.create(**PYTYPE_OPTIONS)
         loader = pytype_loader.create_loader(options)
 
         # Add results to a dictionary keyed by the file name.
         results_dict: dict[str, str] = {}
+        diagnostics: dict[str, list[Diagnostic]] = {}
+        test_durations: dict[str, float] = {}
 
-        for fi in tqdm(os.listdir(".")):
-            if not fi.endswith(".py"):
-                continue
+        for fi in tqdm(files) if show_progress else files:
+            start_time = time()
             options.tweak(input=fi)
             with open(fi, "r") as test_file:
                 src = test_file.read()
@@ -333,13 +1022,30 @@ class PytypeTypeChecker(TypeChecker):
                 )
             except Exception as e:
                 results_dict[fi] = f"{e.__class__.__name__}: {e}\n"
+                diagnostics[fi] = []
             else:
-                results_dict[fi] = self.enforce_consistent_order(
-                    analysis.context.errorlog
-                )
-        return results_dict
+                errors = self.enforce_consistent_order(analysis.context.errorlog)
+                results_dict[fi] = "\n".join(map(str, errors)) + "\n"
+                diagnostics[fi] = [self.make_diagnostic(fi, error) for error in errors]
+            test_durations[fi] = time() - start_time
+        return results_dict, diagnostics, test_durations
+
+    def make_diagnostic(self, file_name: str, error: "pytype_errors.Error") -> Diagnostic:
+        # The formatted error is followed by the source line it refers to
+        # and possibly a traceback, so only its first line is kept.
+        return Diagnostic(
+            file=file_name,
+            line=error.line,
+            column=None,
+            severity="error",
+            code=error.name,
+            message=error.message,
+            text=str(error).split("\n")[0],
+        )
 
-    def enforce_consistent_order(self, log: pytype_errors.ErrorLog) -> str:
+    def enforce_consistent_order(
+        self, log: "pytype_errors.ErrorLog"
+    ) -> list["pytype_errors.Error"]:
         """Pytype does not guarantee deterministic output across runs.
         It does order diagnostics by line number, but if multiple errors
         occur on the same line, the ordering appears to change from one
@@ -349,7 +1055,7 @@ class PytypeTypeChecker(TypeChecker):
         """
 
         class ErrorSorter:
-            def __init__(self, err: pytype_errors.Error) -> None:
+            def __init__(self, err: "pytype_errors.Error") -> None:
                 # Overwrite the details in the error because these can be
                 # nondeterministic (differ from run to run) in some cases.
                 err._details = ""
@@ -372,22 +1078,210 @@ class PytypeTypeChecker(TypeChecker):
             error for error in log.unique_sorted_errors()
         ]
         errors.sort(key=ErrorSorter)
-        return "\n".join(map(str, errors)) + "\n"
+        return errors
 
-    def parse_errors(self, output: Sequence[str]) -> dict[int, list[str]]:
+    def parse_diagnostics(self, output: str) -> list[Diagnostic]:
         # annotations_forward_refs.py:103:1: unexpected indent [python-compiler-error]
-        line_to_errors: dict[int, list[str]] = {}
-        for line in output:
-            match = re.search(r"^[a-zA-Z0-9_]+.py:(\d+):(\d+): ", line)
+        diagnostics: list[Diagnostic] = []
+        for line in output.splitlines():
+            match = re.search(r"^([a-zA-Z0-9_]+.py):(\d+):(\d+): (.*)", line)
             if match is not None:
-                lineno = int(match.group(1))
-                line_to_errors.setdefault(int(lineno), []).append(line)
-        return line_to_errors
+                file_name, lineno, col_number, message = match.groups()
+                code_match = re.search(r" \[([a-z0-9-]+)\]$", message)
+                diagnostics.append(
+                    Diagnostic(
+                        file=file_name,
+                        line=int(lineno),
+                        column=int(col_number),
+                        severity="error",
+                        code=code_match.group(1) if code_match is not None else None,
+                        message=message,
+                        text=line,
+                    )
+                )
+        return diagnostics
 
 
-TYPE_CHECKERS: Sequence[TypeChecker] = (
-    MypyTypeChecker(),
-    PyrightTypeChecker(),
-    PyreTypeChecker(),
-    PytypeTypeChecker(),
-)
+class CommandTypeChecker(TypeChecker):
+    """
+    Runs a type checker command that writes its diagnostics to stdout,
+    for type checkers that are registered with a command rather than an
+    implementation in this package.
+
+    With the "json-lines" format, each line is an object with "file",
+    "line" and "message" fields, and optional "column", "severity" and
+    "code" fields. The severity defaults to "error". With the "sarif"
+    format, the output is a SARIF log and each result is a diagnostic.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        command: Sequence[str],
+        version_command: Sequence[str] | None = None,
+        install_command: Sequence[str] | None = None,
+        format: str = "json-lines",
+        error_severities: Sequence[str] = ("error",),
+    ) -> None:
+        if format not in ("json-lines", "sarif"):
+            raise ValueError(f"Unknown output format {format!r} for {name}")
+        self._name = name
+        self._command = list(command)
+        self._version_command = version_command
+        self._install_command = install_command
+        self._format = format
+        self._error_severities = tuple(error_severities)
+        self._diagnostics: dict[str, list[Diagnostic]] = {}
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def install(self) -> bool:
+        if self._install_command is None:
+            if shutil.which(self._command[0]) is None:
+                print(f"Unable to find {self._command[0]} for {self.name}")
+                return False
+            return True
+
+        try:
+            run(self._install_command, check=True)
+            return True
+        except (CalledProcessError, FileNotFoundError):
+            print(f"Unable to install {self.name}")
+            return False
+
+    def get_version(self) -> str:
+        if self._version_command is None:
+            return self.name
+        proc = run(self._version_command, stdout=PIPE, text=True)
+        return proc.stdout.strip()
+
+    def get_options(self) -> Sequence[str]:
+        return [*self._command, self._format, *self._error_severities]
+
+    def run_tests(self, test_files: Sequence[str]) -> dict[str, str]:
+        files = list(get_files_to_check(test_files))
+        if "{files}" in self._command:
+            index = self._command.index("{files}")
+            command = [*self._command[:index], *files, *self._command[index + 1 :]]
+        else:
+            command = [*self._command, *files]
+
+        self._diagnostics = {}
+        if self._format == "json-lines":
+            run_with_usage(command, stdout=PIPE, text=True, on_line=self.add_json_line)
+        else:
+            proc = run_with_usage(command, stdout=PIPE, text=True)
+            self.add_sarif_log(json.loads(proc.stdout))
+
+        # Add results to a dictionary keyed by the file name.
+        return {
+            file_name: "".join(self._format_diagnostic(d) for d in diagnostics)
+            for file_name, diagnostics in self._diagnostics.items()
+        }
+
+    def get_diagnostics(self) -> dict[str, list[Diagnostic]]:
+        return self._diagnostics
+
+    def add_json_line(self, line: str) -> None:
+        # Skip anything that isn't a diagnostic, such as a banner or summary.
+        if not line.lstrip().startswith("{"):
+            return
+        try:
+            diagnostic = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(diagnostic, dict):
+            return
+        self._add_diagnostic(
+            diagnostic["file"],
+            diagnostic["line"],
+            diagnostic.get("column"),
+            diagnostic.get("severity", "error"),
+            diagnostic.get("code"),
+            diagnostic["message"],
+        )
+
+    def add_sarif_log(self, log: dict[str, Any]) -> None:
+        for sarif_run in log.get("runs", []):
+            for result in sarif_run.get("results", []):
+                # Skip results that aren't reported at a location in a file.
+                locations = result.get("locations", [])
+                if not locations or "physicalLocation" not in locations[0]:
+                    continue
+                location = locations[0]["physicalLocation"]
+                region = location.get("region", {})
+                self._add_diagnostic(
+                    location["artifactLocation"]["uri"],
+                    region.get("startLine", 1),
+                    region.get("startColumn"),
+                    # The default level for a SARIF result is "warning".
+                    result.get("level", "warning"),
+                    result.get("ruleId"),
+                    result["message"].get("text", ""),
+                )
+
+    def _add_diagnostic(
+        self,
+        file: str,
+        line: int,
+        column: int | None,
+        severity: str,
+        code: str | None,
+        message: str,
+    ) -> None:
+        file_name = file.replace("\\", "/").split("/")[-1]
+        location = f"{file_name}:{line}:{column}" if column is not None else f"{file_name}:{line}"
+        first_line = message.split("\n")[0]
+        text = f"{location}: {severity}: {first_line}"
+        if code is not None:
+            text += f" [{code}]"
+        self._diagnostics.setdefault(file_name, []).append(
+            Diagnostic(
+                file=file_name,
+                line=line,
+                column=column,
+                severity=severity,
+                code=code,
+                message=message,
+                text=text,
+            )
+        )
+
+    def _format_diagnostic(self, diagnostic: Diagnostic) -> str:
+        # Any further lines of the message are indented below the first.
+        _, *message_lines = diagnostic.message.split("\n")
+        return f"{diagnostic.text}\n" + "".join(f"    {line}\n" for line in message_lines)
+
+    def parse_diagnostics(self, output: str) -> list[Diagnostic]:
+        # example.py:12:5: error: Expression is of type "int" [assert-type]
+        diagnostics: list[Diagnostic] = []
+        for line in output.splitlines():
+            # Indented lines continue the message of the previous diagnostic.
+            if line.startswith("    ") and diagnostics:
+                diagnostics[-1] = replace(
+                    diagnostics[-1], message=f"{diagnostics[-1].message}\n{line[4:]}"
+                )
+                continue
+            match = re.fullmatch(
+                r"([^:]+):(\d+):(?:(\d+):)? (\w+): (.*?)(?: \[([^\]]+)\])?", line
+            )
+            if match is None:
+                continue
+            file_name, lineno, col_number, severity, message, code = match.groups()
+            diagnostics.append(
+                Diagnostic(
+                    file=file_name,
+                    line=int(lineno),
+                    column=int(col_number) if col_number is not None else None,
+                    severity=severity,
+                    code=code,
+                    message=message,
+                    text=line,
+                )
+            )
+        return diagnostics
+
+    def is_error(self, diagnostic: Diagnostic) -> bool:
+        return diagnostic.severity in self._error_severities
@@ -6,24 +6,17 @@ conformance results differ.
 """
 
 from pathlib import Path
-import tomllib
 
-results_dir = Path(__file__).resolve().parent.parent / "results"
+from results_store import ResultsStore
 
-for type_checker_dir in sorted(results_dir.iterdir()):
-    if type_checker_dir.is_dir():
-        for file in sorted(type_checker_dir.iterdir()):
-            if file.name == "version.toml":
-                continue
-            with file.open("rb") as f:
-                try:
-                    info = tomllib.load(f)
-                except Exception as e:
-                    raise Exception(f"Error decoding {file}") from e
-            try:
-                previous_pass = info["conformant"] == "Pass"
-                new_pass = info["conformance_automated"] == "Pass"
-            except KeyError as e:
-                raise Exception(f"Missing key in {file}") from e
+root_dir = Path(__file__).resolve().parent.parent
+
+with ResultsStore(root_dir) as store:
+    for type_checker in store.get_checkers():
+        for test_name, result in sorted(store.get_results(type_checker).items()):
+            if result.conformant is None or result.conformance_automated is None:
+                raise Exception(f"Missing key in {type_checker}/{test_name}.toml")
+            previous_pass = result.conformant == "Pass"
+            new_pass = result.conformance_automated == "Pass"
             if previous_pass != new_pass:
-                print(f"{file.relative_to(results_dir)}: {info['conformant']} vs. {info['conformance_automated']}")
+                print(f"{type_checker}/{test_name}.toml: {result.conformant} vs. {result.conformance_automated}")